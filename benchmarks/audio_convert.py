@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark of voice audio format conversion (src/chat/audio_format.py).
+
+Streams synthetic audio through AudioConverter in client-sized chunks for
+each supported conversion and reports the CPU time spent per second of
+audio and the realtime factor (audio seconds converted per CPU second).
+Only needs NumPy; the module is loaded straight from the source tree:
+
+    python benchmarks/audio_convert.py --seconds 30 --chunk-ms 20 \\
+        --report audio_convert.json
+
+Use --max-ms-per-second to fail (exit 1) when any conversion is slower.
+"""
+import argparse
+import importlib.util
+import json
+import platform
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+MODULE_PATH = (
+    Path(__file__).resolve().parent.parent / "src" / "chat" / "audio_format.py"
+)
+
+# (client format, direction); inbound converts to the Realtime API's format
+CASES = [
+    ("f32:48000:2", "in"),
+    ("f32:48000:1", "in"),
+    ("s16:48000:1", "in"),
+    ("f32:44100:1", "in"),
+    ("s16:44100:2", "in"),
+    ("s16:16000:1", "in"),
+    ("f32:48000:2", "out"),
+    ("f32:44100:1", "out"),
+    ("s16:48000:1", "out"),
+]
+
+
+def load_audio_format():
+    spec = importlib.util.spec_from_file_location("audio_format", MODULE_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def synthesize(audio_format, seconds: float) -> bytes:
+    """Speech-like test signal: a few tones plus noise"""
+    rate = audio_format.sample_rate
+    t = np.arange(int(rate * seconds)) / rate
+    rng = np.random.default_rng(0)
+    signal = (
+        0.3 * np.sin(2 * np.pi * 220 * t)
+        + 0.2 * np.sin(2 * np.pi * 1250 * t)
+        + 0.05 * rng.standard_normal(len(t))
+    )
+    signal = np.repeat(signal, audio_format.channels)
+    if audio_format.encoding == "s16":
+        return (signal * 32767).astype("<i2").tobytes()
+    return signal.astype("<f4").tobytes()
+
+
+def run_case(module, client: str, direction: str, seconds: float, chunk_ms: int) -> Dict:
+    client_format = module.AudioFormat.parse(client)
+    if direction == "in":
+        source, target = client_format, module.REALTIME_FORMAT
+    else:
+        source, target = module.REALTIME_FORMAT, client_format
+    converter = module.AudioConverter(source, target)
+    audio = synthesize(source, seconds)
+    chunk_size = source.sample_rate * chunk_ms // 1000 * source.frame_size
+    chunks = [
+        audio[offset:offset + chunk_size]
+        for offset in range(0, len(audio), chunk_size)
+    ]
+    # Warm up NumPy and the filter state outside the timed loop
+    module.AudioConverter(source, target).convert(chunks[0])
+    output_bytes = 0
+    started = time.process_time()
+    for chunk in chunks:
+        output_bytes += len(converter.convert(chunk))
+    cpu = time.process_time() - started
+    return {
+        "source": str(source),
+        "target": str(target),
+        "chunks": len(chunks),
+        "output_seconds": round(output_bytes / target.frame_size / target.sample_rate, 3),
+        "cpu_ms_per_audio_second": round(cpu * 1000 / seconds, 4),
+        "realtime_factor": round(seconds / cpu, 1) if cpu else None
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--seconds", type=float, default=30.0)
+    parser.add_argument("--chunk-ms", type=int, default=20)
+    parser.add_argument("--report", help="write the JSON report here")
+    parser.add_argument(
+        "--max-ms-per-second", type=float,
+        help="exit 1 if a conversion costs more CPU per audio second"
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    module = load_audio_format()
+    results: List[Dict] = []
+    for client, direction in CASES:
+        result = run_case(module, client, direction, args.seconds, args.chunk_ms)
+        results.append(result)
+        print(
+            f"{result['source']:>12} -> {result['target']:<12} "
+            f"{result['cpu_ms_per_audio_second']:8.3f} ms/s  "
+            f"x{result['realtime_factor']}"
+        )
+    report = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "seconds": args.seconds,
+        "chunk_ms": args.chunk_ms,
+        "results": results
+    }
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.max_ms_per_second is not None:
+        slow = [
+            r for r in results
+            if r["cpu_ms_per_audio_second"] > args.max_ms_per_second
+        ]
+        if slow:
+            print(f"{len(slow)} conversions over the limit", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
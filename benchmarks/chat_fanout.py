@@ -0,0 +1,471 @@
+#!/usr/bin/env python3
+"""
+Load generator and fan-out latency benchmark for /chat/ws/{room_id}.
+
+Registers (or logs in) one user per client and spreads the clients over
+the rooms. Some clients in each room send messages and typing updates at
+fixed rates. Every client measures how long each message takes to reach
+it. The report has latency percentiles, throughput, errors, the server's
+RSS and the server's /chat/stats, and is written as JSON.
+
+Run it against a local stack (uvicorn + Postgres + Redis):
+
+    uvicorn main:app --port 8000 &
+    python benchmarks/chat_fanout.py --clients 2000 --rooms 20 \\
+        --server-pid $(pgrep -f "uvicorn main:app" | head -1) \\
+        --report fanout.json
+
+Thousands of sockets need a high open-file limit (ulimit -n) on both
+sides. The server's rate limits (CHAT_RATE_LIMIT_*) must allow the
+configured rates. Use --max-p99-ms to fail (exit 1) on regressions.
+"""
+import argparse
+import asyncio
+import json
+import platform
+import resource
+import statistics
+import sys
+import time
+from array import array
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import aiohttp
+import websockets
+
+BENCH_PREFIX = "bench:"
+
+
+class Results:
+    """Counters shared by every simulated client"""
+
+    def __init__(self):
+        self.latencies = array("d")
+        self.sent_messages = 0
+        self.sent_typing = 0
+        self.received_frames = 0
+        self.received_messages = 0
+        self.errors: Dict[str, int] = {}
+        self.connect_failures = 0
+        self.disconnects = 0
+        self.connect_times = array("d")
+        self.rss_samples: List[int] = []
+        self.recording = False
+
+    def error(self, kind: str):
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    index = min(len(values) - 1, int(round(fraction * (len(values) - 1))))
+    return values[index]
+
+
+def latency_summary(latencies) -> Dict:
+    values = sorted(latencies)
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean_ms": statistics.fmean(values) * 1000,
+        "p50_ms": percentile(values, 0.50) * 1000,
+        "p90_ms": percentile(values, 0.90) * 1000,
+        "p99_ms": percentile(values, 0.99) * 1000,
+        "p999_ms": percentile(values, 0.999) * 1000,
+        "max_ms": values[-1] * 1000
+    }
+
+
+def read_rss(pid: int) -> Optional[int]:
+    """Resident set size of a local process in bytes"""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+async def get_token(
+    session: aiohttp.ClientSession, base_url: str, email: str, password: str
+) -> str:
+    credentials = {"email": email, "password": password}
+    async with session.post(f"{base_url}/auth/register", json=credentials) as r:
+        if r.status == 200:
+            return (await r.json())["access_token"]
+    # Already registered by an earlier run
+    form = {"username": email, "password": password}
+    async with session.post(f"{base_url}/auth/token", data=form) as r:
+        r.raise_for_status()
+        return (await r.json())["access_token"]
+
+
+async def prepare(args) -> Dict:
+    """Register users, create the rooms and make every user a member"""
+    connector = aiohttp.TCPConnector(limit=args.setup_concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        gate = asyncio.Semaphore(args.setup_concurrency)
+
+        async def token_for(index: int) -> str:
+            async with gate:
+                return await get_token(
+                    session, args.base_url,
+                    f"{args.user_prefix}{index}@example.com", args.password
+                )
+
+        tokens = await asyncio.gather(
+            *(token_for(index) for index in range(args.clients))
+        )
+
+        owner = {"Authorization": f"Bearer {tokens[0]}"}
+        room_ids = []
+        for index in range(args.rooms):
+            async with session.post(
+                f"{args.base_url}/chat/rooms",
+                json={"name": f"bench-{index}", "is_public": True},
+                headers=owner
+            ) as r:
+                r.raise_for_status()
+                room_ids.append((await r.json())["id"])
+            if args.batch_window_ms:
+                async with session.put(
+                    f"{args.base_url}/chat/rooms/{room_ids[-1]}/batching",
+                    json={"window_ms": args.batch_window_ms},
+                    headers=owner
+                ) as r:
+                    r.raise_for_status()
+
+        async def join(index: int):
+            async with gate:
+                room_id = room_ids[index % args.rooms]
+                async with session.post(
+                    f"{args.base_url}/chat/rooms/{room_id}/join",
+                    headers={"Authorization": f"Bearer {tokens[index]}"}
+                ) as r:
+                    r.raise_for_status()
+
+        await asyncio.gather(*(join(index) for index in range(args.clients)))
+    return {"tokens": tokens, "room_ids": room_ids}
+
+
+class Client:
+    def __init__(
+        self, index: int, room_id: int, token: str, sender: bool, args,
+        results: Results
+    ):
+        self.index = index
+        self.room_id = room_id
+        self.token = token
+        self.sender = sender
+        self.args = args
+        self.results = results
+        self.binary = args.codec == "msgpack"
+        if self.binary:
+            import msgpack
+            self.encode = lambda message: msgpack.packb(message)
+            self.decode = lambda data: msgpack.unpackb(data, raw=False)
+        else:
+            self.encode = json.dumps
+            self.decode = json.loads
+
+    @property
+    def url(self) -> str:
+        ws_base = self.args.base_url.replace("http", "ws", 1)
+        return f"{ws_base}/chat/ws/{self.room_id}"
+
+    async def run(self, connected: asyncio.Event, stop: asyncio.Event):
+        subprotocols = [
+            "chat.msgpack" if self.binary else "chat.json",
+            f"auth.bearer.{self.token}"
+        ]
+        started = time.perf_counter()
+        try:
+            websocket = await websockets.connect(
+                self.url,
+                subprotocols=subprotocols,
+                ping_interval=None,
+                max_size=None,
+                open_timeout=30
+            )
+        except Exception:
+            self.results.connect_failures += 1
+            connected.set()
+            return
+        self.results.connect_times.append(time.perf_counter() - started)
+        connected.set()
+        tasks = [asyncio.create_task(self.receive(websocket))]
+        if self.sender:
+            tasks.append(asyncio.create_task(self.send_messages(websocket)))
+            if self.args.typing_rate > 0:
+                tasks.append(asyncio.create_task(self.send_typing(websocket)))
+        try:
+            await stop.wait()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await websocket.close()
+
+    async def receive(self, websocket):
+        results = self.results
+        try:
+            async for data in websocket:
+                received_at = time.monotonic()
+                frame = self.decode(data)
+                events = frame["events"] if frame.get("type") == "batch" else [frame]
+                for event in events:
+                    if results.recording:
+                        results.received_frames += 1
+                    kind = event.get("type")
+                    if kind == "message":
+                        content = event.get("content", "")
+                        if content.startswith(BENCH_PREFIX) and results.recording:
+                            sent_at = float(content.split(":", 2)[1])
+                            results.latencies.append(received_at - sent_at)
+                            results.received_messages += 1
+                    elif kind == "ping":
+                        await websocket.send(self.encode({"type": "pong"}))
+                    elif kind == "error":
+                        results.error(event.get("code", "error"))
+        except websockets.ConnectionClosed:
+            self.results.disconnects += 1
+
+    async def send_messages(self, websocket):
+        await self.paced(websocket, self.args.message_rate, self.message)
+
+    async def send_typing(self, websocket):
+        await self.paced(websocket, self.args.typing_rate, self.typing)
+
+    def message(self, sequence: int) -> dict:
+        # All clients share this process, so monotonic time is comparable
+        filler = "x" * self.args.message_size
+        return {
+            "type": "message",
+            "content": f"{BENCH_PREFIX}{time.monotonic()}:{self.index}:{sequence}:{filler}"
+        }
+
+    def typing(self, sequence: int) -> dict:
+        return {"type": "typing", "is_typing": sequence % 2 == 0}
+
+    async def paced(self, websocket, rate: float, build):
+        if rate <= 0:
+            return
+        interval = 1 / rate
+        # Spread senders over the first interval instead of a thundering herd
+        await asyncio.sleep(interval * ((self.index * 0.618) % 1))
+        next_at = time.monotonic()
+        sequence = 0
+        try:
+            while True:
+                await websocket.send(self.encode(build(sequence)))
+                if self.results.recording:
+                    if build == self.message:
+                        self.results.sent_messages += 1
+                    else:
+                        self.results.sent_typing += 1
+                sequence += 1
+                next_at += interval
+                await asyncio.sleep(max(0.0, next_at - time.monotonic()))
+        except websockets.ConnectionClosed:
+            pass
+
+
+async def sample_rss(pid: int, results: Results, stop: asyncio.Event):
+    while not stop.is_set():
+        rss = read_rss(pid)
+        if rss is not None:
+            results.rss_samples.append(rss)
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=1)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def fetch_stats(base_url: str) -> Optional[Dict]:
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"{base_url}/chat/stats") as r:
+                return await r.json()
+    except Exception as e:
+        return {"error": str(e)}
+
+
+async def run(args) -> Dict:
+    results = Results()
+    setup_started = time.perf_counter()
+    prepared = await prepare(args)
+    setup_seconds = time.perf_counter() - setup_started
+    room_ids = prepared["room_ids"]
+
+    stop = asyncio.Event()
+    sampler = None
+    rss_before = None
+    if args.server_pid:
+        rss_before = read_rss(args.server_pid)
+        sampler = asyncio.create_task(
+            sample_rss(args.server_pid, results, stop)
+        )
+
+    # The first senders_per_room clients of each room send
+    clients = []
+    for index, token in enumerate(prepared["tokens"]):
+        clients.append(Client(
+            index, room_ids[index % args.rooms], token,
+            index // args.rooms < args.senders_per_room, args, results
+        ))
+
+    ramp_started = time.perf_counter()
+    tasks = []
+    for client in clients:
+        connected = asyncio.Event()
+        tasks.append(asyncio.create_task(client.run(connected, stop)))
+        if args.ramp_rate > 0:
+            await asyncio.sleep(1 / args.ramp_rate)
+        else:
+            await connected.wait()
+    ramp_seconds = time.perf_counter() - ramp_started
+    rss_connected = read_rss(args.server_pid) if args.server_pid else None
+
+    await asyncio.sleep(args.warmup)
+    results.recording = True
+    measured_started = time.perf_counter()
+    await asyncio.sleep(args.duration)
+    results.recording = False
+    measured_seconds = time.perf_counter() - measured_started
+
+    server_stats = await fetch_stats(args.base_url)
+    stop.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    if sampler is not None:
+        await sampler
+
+    # Every message should reach every other socket in its room
+    room_size = args.clients / args.rooms
+    expected = results.sent_messages * room_size
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "host": platform.node(),
+        "python": sys.version.split()[0],
+        "config": vars(args),
+        "setup_seconds": setup_seconds,
+        "ramp_seconds": ramp_seconds,
+        "measured_seconds": measured_seconds,
+        "connections": {
+            "opened": len(results.connect_times),
+            "failed": results.connect_failures,
+            "closed_by_server": results.disconnects,
+            "connect_latency": latency_summary(results.connect_times)
+        },
+        "sent": {
+            "messages": results.sent_messages,
+            "typing": results.sent_typing,
+            "messages_per_second": results.sent_messages / measured_seconds
+        },
+        "received": {
+            "frames": results.received_frames,
+            "messages": results.received_messages,
+            "deliveries_per_second": results.received_messages / measured_seconds,
+            "delivery_ratio": (
+                results.received_messages / expected if expected else None
+            )
+        },
+        "latency": latency_summary(results.latencies),
+        "errors": results.errors,
+        "server_memory": {
+            "rss_before": rss_before,
+            "rss_connected": rss_connected,
+            "rss_peak": max(results.rss_samples, default=None),
+            "rss_per_connection": (
+                (rss_connected - rss_before) / len(results.connect_times)
+                if rss_before and rss_connected and results.connect_times
+                else None
+            )
+        },
+        "server_stats": server_stats
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--rooms", type=int, default=10)
+    parser.add_argument("--senders-per-room", type=int, default=2)
+    parser.add_argument(
+        "--message-rate", type=float, default=1.0,
+        help="messages per second per sender"
+    )
+    parser.add_argument(
+        "--typing-rate", type=float, default=2.0,
+        help="typing updates per second per sender"
+    )
+    parser.add_argument("--message-size", type=int, default=64)
+    parser.add_argument("--codec", choices=("json", "msgpack"), default="json")
+    parser.add_argument(
+        "--batch-window-ms", type=int, default=0,
+        help="enable per-room micro-batching with this window"
+    )
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--warmup", type=float, default=5.0)
+    parser.add_argument(
+        "--ramp-rate", type=float, default=200.0,
+        help="new connections per second; 0 opens them one at a time"
+    )
+    parser.add_argument("--setup-concurrency", type=int, default=50)
+    parser.add_argument("--user-prefix", default="bench")
+    parser.add_argument("--password", default="bench-password")
+    parser.add_argument(
+        "--server-pid", type=int,
+        help="sample this local process's RSS during the run"
+    )
+    parser.add_argument("--report", help="write the JSON report here")
+    parser.add_argument(
+        "--max-p99-ms", type=float,
+        help="exit with status 1 if p99 latency is above this"
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if args.clients < args.rooms:
+        print("--clients must be at least --rooms", file=sys.stderr)
+        return 2
+    raise_fd_limit()
+    report = asyncio.run(run(args))
+    output = json.dumps(report, indent=2)
+    if args.report:
+        with open(args.report, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+    latency = report["latency"]
+    print(
+        f"{report['connections']['opened']} sockets, "
+        f"{report['sent']['messages_per_second']:.1f} msg/s in, "
+        f"{report['received']['deliveries_per_second']:.1f} deliveries/s out, "
+        f"p50 {latency.get('p50_ms', 0):.2f} ms, "
+        f"p99 {latency.get('p99_ms', 0):.2f} ms",
+        file=sys.stderr
+    )
+    if args.max_p99_ms is not None and (
+        latency["count"] == 0 or latency["p99_ms"] > args.max_p99_ms
+    ):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the OpenAI Realtime API WebSocket, for load tests.
+
+Speaks the subset of the realtime protocol that VoiceChatManager uses:
+session.update, input_audio_buffer.append/commit, conversation.item.create,
+response.create and response.cancel in; session, speech, transcription,
+text, audio and error events out. Responses are scripted: after
+--first-delta-ms the server streams --deltas audio deltas of --delta-ms of
+24 kHz PCM16 each, paced at --speed times realtime. Nothing is billed.
+
+Point the app at it and start both:
+
+    python benchmarks/fake_realtime_server.py --port 8765 &
+    OPENAI_REALTIME_URL=ws://localhost:8765/v1 uvicorn main:app --port 8000
+
+Any path is accepted, so the client's /v1/realtime?model=... works as is.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import math
+import sys
+import time
+import uuid
+from array import array
+from typing import Dict, Optional
+
+import websockets
+
+SAMPLE_RATE = 24000
+
+logger = logging.getLogger("fake_realtime")
+
+
+def tone(milliseconds: int, frequency: float = 440.0) -> str:
+    """Base64 PCM16 sine tone, the payload of every audio delta"""
+    count = SAMPLE_RATE * milliseconds // 1000
+    samples = array("h", (
+        int(8000 * math.sin(2 * math.pi * frequency * i / SAMPLE_RATE))
+        for i in range(count)
+    ))
+    if sys.byteorder != "little":
+        samples.byteswap()
+    return base64.b64encode(samples.tobytes()).decode("ascii")
+
+
+def event_id() -> str:
+    return f"event_{uuid.uuid4().hex[:16]}"
+
+
+class FakeSession:
+    """One client connection and its scripted responses"""
+
+    def __init__(self, websocket, args, stats: Dict[str, int]):
+        self.websocket = websocket
+        self.args = args
+        self.stats = stats
+        self.session_id = f"sess_{uuid.uuid4().hex[:16]}"
+        self.speaking = False
+        self.buffered_bytes = 0
+        self.response: Optional[asyncio.Task] = None
+
+    async def send(self, event_type: str, **fields):
+        await self.websocket.send(json.dumps(
+            {"event_id": event_id(), "type": event_type, **fields}
+        ))
+        self.stats["events_out"] += 1
+
+    async def run(self):
+        self.stats["sessions"] += 1
+        self.stats["open_sessions"] += 1
+        try:
+            await self.send("session.created", session={"id": self.session_id})
+            async for raw in self.websocket:
+                self.stats["events_in"] += 1
+                await self.handle(json.loads(raw))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            self.stats["open_sessions"] -= 1
+            if self.response is not None:
+                self.response.cancel()
+
+    async def handle(self, event: Dict):
+        kind = event.get("type")
+        if kind == "session.update":
+            await asyncio.sleep(self.args.session_ms / 1000)
+            await self.send(
+                "session.updated",
+                session={"id": self.session_id, **event.get("session", {})}
+            )
+        elif kind == "input_audio_buffer.append":
+            # Length of the decoded audio without decoding it
+            audio = event.get("audio", "")
+            decoded = len(audio) * 3 // 4 - audio[-2:].count("=")
+            self.buffered_bytes += decoded
+            self.stats["audio_bytes_in"] += decoded
+            if not self.speaking:
+                self.speaking = True
+                await self.send("input_audio_buffer.speech_started", audio_start_ms=0)
+        elif kind == "input_audio_buffer.commit":
+            item_id = f"item_{uuid.uuid4().hex[:16]}"
+            if self.speaking:
+                self.speaking = False
+                await self.send("input_audio_buffer.speech_stopped", item_id=item_id)
+            await self.send("input_audio_buffer.committed", item_id=item_id)
+            asyncio.create_task(self.transcribe(item_id, self.buffered_bytes))
+            self.buffered_bytes = 0
+        elif kind == "conversation.item.create":
+            await self.send("conversation.item.created", item=event.get("item", {}))
+        elif kind == "response.create":
+            if self.response is not None and not self.response.done():
+                await self.send("error", error={
+                    "type": "invalid_request_error",
+                    "message": "Conversation already has an active response"
+                })
+                return
+            self.response = asyncio.create_task(self.respond())
+        elif kind == "response.cancel":
+            if self.response is not None and not self.response.done():
+                self.response.cancel()
+                await self.send("response.done", response={"status": "cancelled"})
+        else:
+            await self.send("error", error={
+                "type": "invalid_request_error",
+                "message": f"Unsupported event type {kind!r}"
+            })
+
+    async def transcribe(self, item_id: str, audio_bytes: int):
+        await asyncio.sleep(self.args.transcript_ms / 1000)
+        seconds = audio_bytes / 2 / SAMPLE_RATE
+        await self.send(
+            "conversation.item.input_audio_transcription.completed",
+            item_id=item_id, content_index=0,
+            transcript=f"({seconds:.1f} seconds of audio)"
+        )
+
+    async def respond(self):
+        response_id = f"resp_{uuid.uuid4().hex[:16]}"
+        ids = {"response_id": response_id, "item_id": f"item_{uuid.uuid4().hex[:16]}",
+               "output_index": 0, "content_index": 0}
+        self.stats["responses"] += 1
+        await self.send("response.created", response={"id": response_id})
+        await asyncio.sleep(self.args.first_delta_ms / 1000)
+        text = "This is a scripted response."
+        for word in text.split():
+            await self.send("response.text.delta", delta=f"{word} ", **ids)
+        await self.send("response.text.done", text=text, **ids)
+        interval = self.args.delta_ms / 1000 / self.args.speed
+        started = time.monotonic()
+        for index in range(self.args.deltas):
+            await self.send("response.audio.delta", delta=self.args.audio, **ids)
+            self.stats["audio_deltas_out"] += 1
+            # Paced against the start so send time does not accumulate
+            delay = started + (index + 1) * interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await self.send("response.audio.done", **ids)
+        await self.send("response.done", response={"id": response_id, "status": "completed"})
+
+
+async def serve(args):
+    stats = {
+        "sessions": 0, "open_sessions": 0, "events_in": 0, "events_out": 0,
+        "responses": 0, "audio_deltas_out": 0, "audio_bytes_in": 0
+    }
+
+    async def handler(websocket, *_):
+        await FakeSession(websocket, args, stats).run()
+
+    async with websockets.serve(handler, args.host, args.port, max_size=None):
+        logger.info(f"Fake realtime server on ws://{args.host}:{args.port}/v1")
+        while True:
+            await asyncio.sleep(args.stats_interval)
+            logger.info(json.dumps(stats))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--session-ms", type=int, default=50,
+                        help="delay before session.updated")
+    parser.add_argument("--transcript-ms", type=int, default=200,
+                        help="delay from commit to the input transcription")
+    parser.add_argument("--first-delta-ms", type=int, default=300,
+                        help="delay from response.create to the first audio delta")
+    parser.add_argument("--delta-ms", type=int, default=100,
+                        help="audio per response.audio.delta")
+    parser.add_argument("--deltas", type=int, default=20,
+                        help="audio deltas per response")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="delta pacing relative to realtime")
+    parser.add_argument("--stats-interval", type=float, default=10.0)
+    args = parser.parse_args(argv)
+    args.audio = tone(args.delta_ms)
+    return args
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Voice pipeline latency benchmark for /chat/voice/{room_id}.
+
+Drives concurrent voice clients through the app against the local fake
+realtime server (benchmarks/fake_realtime_server.py), so no API usage is
+billed. Each client negotiates binary PCM16 audio, then for every turn it
+streams an utterance in realtime-paced chunks, commits it and reads the
+reply. Reported per concurrency level:
+- time to first audio: audio_commit sent -> first audio frame received
+- inter-chunk jitter: change between consecutive audio frame gaps
+- server CPU per session, from /proc/<pid>/stat of one uvicorn worker
+and the last level before the first one that missed a limit, i.e. the
+maximum sustainable sessions per worker.
+
+    python benchmarks/fake_realtime_server.py --port 8765 &
+    OPENAI_REALTIME_URL=ws://localhost:8765/v1 uvicorn main:app --port 8000 &
+    python benchmarks/voice_latency.py --levels 10,25,50,100 \\
+        --server-pid $(pgrep -f "uvicorn main:app" | head -1) \\
+        --report voice.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import re
+import sys
+import time
+from array import array
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import aiohttp
+import websockets
+
+from chat_fanout import get_token, latency_summary, raise_fd_limit, read_rss
+
+# Benchmark users are <prefix><n>@example.com
+USER_PREFIX = "voicebench-"
+# Characters the register endpoint's EmailStr accepts in a local part
+USER_PREFIX_PATTERN = re.compile(r"^[A-Za-z0-9_+-][A-Za-z0-9._+-]*$")
+SAMPLE_RATE = 24000
+
+
+class LevelResults:
+    """Measurements of every client at one concurrency level"""
+
+    def __init__(self):
+        self.first_audio = array("d")
+        self.gaps = array("d")
+        self.jitter = array("d")
+        self.turns = 0
+        self.audio_frames = 0
+        self.audio_bytes = 0
+        self.connect_failures = 0
+        self.errors: Dict[str, int] = {}
+
+    def error(self, kind: str):
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+
+def utterance_chunk(chunk_ms: int) -> bytes:
+    """One chunk of a 200 Hz PCM16 tone"""
+    count = SAMPLE_RATE * chunk_ms // 1000
+    samples = array("h", (
+        int(6000 * math.sin(2 * math.pi * 200 * i / SAMPLE_RATE))
+        for i in range(count)
+    ))
+    if sys.byteorder != "little":
+        samples.byteswap()
+    return samples.tobytes()
+
+
+def read_cpu_seconds(pid: int) -> Optional[float]:
+    """User + system CPU time of a local process"""
+    try:
+        with open(f"/proc/{pid}/stat") as stat:
+            # Fields after the parenthesised command name
+            fields = stat.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+async def run_client(index: int, token: str, args, chunk: bytes, results: LevelResults):
+    ws_base = args.base_url.replace("http", "ws", 1)
+    url = f"{ws_base}/chat/voice/{args.room_id}"
+    try:
+        websocket = await websockets.connect(
+            url, subprotocols=["voice.pcm16", f"auth.bearer.{token}"],
+            ping_interval=None, max_size=None, open_timeout=30
+        )
+    except Exception:
+        results.connect_failures += 1
+        return
+    chunk_seconds = args.chunk_ms / 1000
+    chunks_per_turn = max(1, args.utterance_ms // args.chunk_ms)
+    try:
+        if websocket.subprotocol != "voice.pcm16":
+            results.error("no_binary_audio")
+            return
+        # Spread the clients' turns over the first chunk
+        await asyncio.sleep(chunk_seconds * index / max(1, args.clients))
+        for _ in range(args.turns):
+            started = time.monotonic()
+            for sent in range(chunks_per_turn):
+                await websocket.send(chunk)
+                delay = started + (sent + 1) * chunk_seconds - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            await websocket.send(json.dumps({"type": "audio_commit"}))
+            committed = time.perf_counter()
+            last = None
+            last_gap = None
+            while True:
+                message = await asyncio.wait_for(
+                    websocket.recv(), timeout=args.response_timeout
+                )
+                now = time.perf_counter()
+                if isinstance(message, bytes):
+                    results.audio_frames += 1
+                    results.audio_bytes += len(message)
+                    if last is None:
+                        results.first_audio.append(now - committed)
+                    else:
+                        gap = now - last
+                        results.gaps.append(gap)
+                        if last_gap is not None:
+                            results.jitter.append(abs(gap - last_gap))
+                        last_gap = gap
+                    last = now
+                    continue
+                event = json.loads(message)
+                if event.get("type") == "audio_done":
+                    break
+                if event.get("type") == "error":
+                    results.error("server_error")
+            results.turns += 1
+            await asyncio.sleep(args.think_ms / 1000)
+    except asyncio.TimeoutError:
+        results.error("response_timeout")
+    except websockets.ConnectionClosed:
+        results.error("disconnected")
+    finally:
+        await websocket.close()
+
+
+async def run_level(level: int, tokens: List[str], args, chunk: bytes) -> Dict:
+    results = LevelResults()
+    cpu_before = read_cpu_seconds(args.server_pid) if args.server_pid else None
+    started = time.monotonic()
+    level_args = argparse.Namespace(**{**vars(args), "clients": level})
+    await asyncio.gather(*(
+        run_client(index, tokens[index], level_args, chunk, results)
+        for index in range(level)
+    ))
+    elapsed = time.monotonic() - started
+    report = {
+        "sessions": level,
+        "duration_s": elapsed,
+        "turns": results.turns,
+        "audio_frames": results.audio_frames,
+        "audio_bytes": results.audio_bytes,
+        "connect_failures": results.connect_failures,
+        "errors": results.errors,
+        "time_to_first_audio": latency_summary(results.first_audio),
+        "inter_chunk_gap": latency_summary(results.gaps),
+        "jitter": latency_summary(results.jitter)
+    }
+    if cpu_before is not None:
+        cpu = read_cpu_seconds(args.server_pid) - cpu_before
+        report["server_cpu_s"] = cpu
+        report["server_cpu_share"] = cpu / elapsed
+        report["cpu_ms_per_session_second"] = cpu * 1000 / (elapsed * level)
+        report["server_rss"] = read_rss(args.server_pid)
+    report["sustainable"] = sustainable(report, args)
+    return report
+
+
+def sustainable(report: Dict, args) -> bool:
+    if report["connect_failures"] or report["errors"]:
+        return False
+    if report["turns"] < report["sessions"] * args.turns:
+        return False
+    ttfa = report["time_to_first_audio"].get("p99_ms")
+    if ttfa is None or ttfa > args.max_ttfa_ms:
+        return False
+    jitter = report["jitter"].get("p99_ms")
+    if jitter is not None and jitter > args.max_jitter_ms:
+        return False
+    share = report.get("server_cpu_share")
+    return share is None or share <= args.max_cpu_share
+
+
+async def prepare(args, count: int) -> List[str]:
+    connector = aiohttp.TCPConnector(limit=args.setup_concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        gate = asyncio.Semaphore(args.setup_concurrency)
+
+        async def token_for(index: int) -> str:
+            async with gate:
+                return await get_token(
+                    session, args.base_url,
+                    f"{args.user_prefix}{index}@example.com", args.password
+                )
+
+        return await asyncio.gather(*(token_for(i) for i in range(count)))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--room-id", type=int, default=1)
+    parser.add_argument("--levels", default="10,25,50",
+                        help="comma-separated concurrent session counts")
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--utterance-ms", type=int, default=2000)
+    parser.add_argument("--chunk-ms", type=int, default=20)
+    parser.add_argument("--think-ms", type=int, default=500)
+    parser.add_argument("--response-timeout", type=float, default=30.0)
+    parser.add_argument("--max-ttfa-ms", type=float, default=1000.0)
+    parser.add_argument("--max-jitter-ms", type=float, default=50.0)
+    parser.add_argument("--max-cpu-share", type=float, default=0.9,
+                        help="fraction of one core the worker may use")
+    parser.add_argument("--server-pid", type=int)
+    parser.add_argument("--user-prefix", default=USER_PREFIX,
+                        help="start of the benchmark users' emails: letters, "
+                        "digits and . _ + - (not leading with a dot)")
+    parser.add_argument("--password", default="bench-password")
+    parser.add_argument("--setup-concurrency", type=int, default=50)
+    parser.add_argument("--report", help="write the JSON report here")
+    args = parser.parse_args(argv)
+    if not USER_PREFIX_PATTERN.match(args.user_prefix):
+        parser.error(
+            f"--user-prefix {args.user_prefix!r} is not valid at the start "
+            f"of an email address"
+        )
+    args.levels = sorted({int(level) for level in args.levels.split(",")})
+    return args
+
+
+async def run(args) -> Dict:
+    tokens = await prepare(args, args.levels[-1])
+    chunk = utterance_chunk(args.chunk_ms)
+    levels = []
+    for level in args.levels:
+        report = await run_level(level, tokens, args, chunk)
+        levels.append(report)
+        ttfa = report["time_to_first_audio"].get("p99_ms")
+        jitter = report["jitter"].get("p99_ms")
+        print(
+            f"{level:5d} sessions: ttfa p99 "
+            f"{ttfa if ttfa is None else round(ttfa, 1)} ms, jitter p99 "
+            f"{jitter if jitter is None else round(jitter, 1)} ms, "
+            f"{'ok' if report['sustainable'] else 'over limits'}"
+        )
+    # Levels run in increasing order; a pass above a failed level is noise
+    sustained = 0
+    for report in levels:
+        if not report["sustainable"]:
+            break
+        sustained = report["sessions"]
+    return {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "settings": {
+            key: value for key, value in vars(args).items()
+            if key not in ("password",)
+        },
+        "levels": levels,
+        "max_sustainable_sessions": sustained
+    }
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    raise_fd_limit()
+    report = asyncio.run(run(args))
+    print(f"max sustainable sessions: {report['max_sustainable_sessions']}")
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0 if report["max_sustainable_sessions"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""add chat room summaries
+
+Revision ID: 0a7d3b9e5c21
+Revises: f29c6a7d4e18
+Create Date: 2026-10-16 14:31:27.443802
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0a7d3b9e5c21'
+down_revision: Union[str, None] = 'f29c6a7d4e18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        'chat_rooms',
+        sa.Column(
+            'member_count', sa.Integer(), nullable=False, server_default='0'
+        )
+    )
+    op.add_column(
+        'chat_rooms', sa.Column('last_message_id', sa.Integer(), nullable=True)
+    )
+    op.add_column(
+        'chat_rooms',
+        sa.Column('last_message_preview', sa.String(length=200), nullable=True)
+    )
+    op.add_column(
+        'chat_rooms',
+        sa.Column(
+            'last_message_at', sa.DateTime(timezone=True), nullable=True
+        )
+    )
+    # Backfill; the latest message per room comes off the history index
+    op.execute(
+        """
+        UPDATE chat_rooms r
+        SET member_count = (
+            SELECT count(*) FROM chat_participants p WHERE p.room_id = r.id
+        )
+        """
+    )
+    op.execute(
+        """
+        UPDATE chat_rooms r
+        SET last_message_id = m.id,
+            last_message_preview = left(m.content, 200),
+            last_message_at = m.created_at
+        FROM chat_rooms r2
+        CROSS JOIN LATERAL (
+            SELECT id, content, created_at
+            FROM messages
+            WHERE room_id = r2.id
+            ORDER BY created_at DESC, id DESC
+            LIMIT 1
+        ) m
+        WHERE r.id = r2.id
+        """
+    )
+    op.create_index(
+        'ix_chat_rooms_created_id',
+        'chat_rooms',
+        ['created_at', 'id'],
+        unique=False
+    )
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.create_index(
+        'ix_chat_rooms_name_trgm',
+        'chat_rooms',
+        ['name'],
+        unique=False,
+        postgresql_using='gin',
+        postgresql_ops={'name': 'gin_trgm_ops'}
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_chat_rooms_name_trgm', table_name='chat_rooms')
+    op.drop_index('ix_chat_rooms_created_id', table_name='chat_rooms')
+    op.drop_column('chat_rooms', 'last_message_at')
+    op.drop_column('chat_rooms', 'last_message_preview')
+    op.drop_column('chat_rooms', 'last_message_id')
+    op.drop_column('chat_rooms', 'member_count')
@@ -0,0 +1,33 @@
+"""add messages history index
+
+Revision ID: 3f6d2a9c81b4
+Revises: e388765ea9d2
+Create Date: 2026-10-16 09:12:40.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f6d2a9c81b4'
+down_revision: Union[str, None] = 'e388765ea9d2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        'ix_messages_room_created_id',
+        'messages',
+        ['room_id', 'created_at', 'id'],
+        unique=False
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_messages_room_created_id', table_name='messages')
@@ -0,0 +1,30 @@
+"""add chat room batch window
+
+Revision ID: 5e2b7d1f9a60
+Revises: 8c41e7b05d3a
+Create Date: 2026-10-16 11:42:05.118364
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e2b7d1f9a60'
+down_revision: Union[str, None] = '8c41e7b05d3a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        'chat_rooms', sa.Column('batch_window_ms', sa.Integer(), nullable=True)
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('chat_rooms', 'batch_window_ms')
@@ -0,0 +1,46 @@
+"""unique chat participant
+
+Revision ID: 8c41e7b05d3a
+Revises: 3f6d2a9c81b4
+Create Date: 2026-10-16 10:03:17.542871
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c41e7b05d3a'
+down_revision: Union[str, None] = '3f6d2a9c81b4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Concurrent joins could insert the same participant twice; keep the
+    # earliest row so the unique index can be built
+    op.execute(
+        """
+        DELETE FROM chat_participants a
+        USING chat_participants b
+        WHERE a.room_id = b.room_id
+          AND a.user_id = b.user_id
+          AND a.id > b.id
+        """
+    )
+    op.create_index(
+        'ux_chat_participants_room_user',
+        'chat_participants',
+        ['room_id', 'user_id'],
+        unique=True
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(
+        'ux_chat_participants_room_user', table_name='chat_participants'
+    )
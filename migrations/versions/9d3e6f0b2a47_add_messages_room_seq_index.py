@@ -0,0 +1,34 @@
+"""add messages room seq index
+
+Revision ID: 9d3e6f0b2a47
+Revises: 0a7d3b9e5c21
+Create Date: 2026-10-16 15:40:12.507391
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d3e6f0b2a47'
+down_revision: Union[str, None] = '0a7d3b9e5c21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Seeding a room's sequence counter reads max(seq) of every partition
+    op.create_index(
+        'ix_messages_room_seq',
+        'messages',
+        ['room_id', 'seq'],
+        unique=False
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_messages_room_seq', table_name='messages')
@@ -0,0 +1,158 @@
+"""partition messages by month
+
+Revision ID: d4a8e1f6c250
+Revises: b71e4c2d9f03
+Create Date: 2026-10-16 13:05:38.271940
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4a8e1f6c250'
+down_revision: Union[str, None] = 'b71e4c2d9f03'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Partitions created up front beyond the current month; after that the
+# maintain_message_partitions Celery task keeps ahead
+MONTHS_AHEAD = 2
+
+COLUMNS = "id, content, room_id, user_id, message_type, created_at"
+
+
+def _drop_indexes() -> None:
+    op.drop_index('ix_messages_search_vector', table_name='messages')
+    op.drop_index('ix_messages_room_created_id', table_name='messages')
+    op.drop_index('ix_messages_id', table_name='messages')
+
+
+def _create_indexes() -> None:
+    op.create_index('ix_messages_id', 'messages', ['id'], unique=False)
+    op.create_index(
+        'ix_messages_room_created_id',
+        'messages',
+        ['room_id', 'created_at', 'id'],
+        unique=False
+    )
+    op.create_index(
+        'ix_messages_search_vector',
+        'messages',
+        ['search_vector'],
+        unique=False,
+        postgresql_using='gin'
+    )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Index names are schema-wide, so free them before building the new table
+    _drop_indexes()
+    op.execute("ALTER TABLE messages RENAME TO messages_legacy")
+    op.execute(
+        "ALTER TABLE messages_legacy "
+        "RENAME CONSTRAINT messages_pkey TO messages_legacy_pkey"
+    )
+    # Keep the id sequence; block-reserved ids must stay monotonic
+    op.execute("ALTER TABLE messages_legacy ALTER COLUMN id DROP DEFAULT")
+    op.execute("ALTER SEQUENCE messages_id_seq OWNED BY NONE")
+
+    # The partition key has to be part of the primary key
+    op.execute(
+        """
+        CREATE TABLE messages (
+            id integer NOT NULL DEFAULT nextval('messages_id_seq'),
+            content text NOT NULL,
+            room_id integer NOT NULL REFERENCES chat_rooms (id),
+            user_id integer NOT NULL REFERENCES users (id),
+            message_type varchar(20),
+            created_at timestamptz NOT NULL DEFAULT now(),
+            search_vector tsvector
+                GENERATED ALWAYS AS (to_tsvector('simple', content)) STORED,
+            CONSTRAINT messages_pkey PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+        """
+    )
+    op.execute("ALTER SEQUENCE messages_id_seq OWNED BY messages.id")
+    op.execute("CREATE TABLE messages_default PARTITION OF messages DEFAULT")
+    # One partition per month from the oldest message to MONTHS_AHEAD out
+    op.execute(
+        f"""
+        DO $$
+        DECLARE
+            month date;
+        BEGIN
+            FOR month IN
+                SELECT generate_series(
+                    date_trunc('month', coalesce(
+                        (SELECT min(created_at) FROM messages_legacy), now()
+                    ) AT TIME ZONE 'UTC'),
+                    date_trunc('month', now() AT TIME ZONE 'UTC')
+                        + interval '{MONTHS_AHEAD} months',
+                    interval '1 month'
+                )::date
+            LOOP
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF messages '
+                    'FOR VALUES FROM (%L) TO (%L)',
+                    'messages_p' || to_char(month, 'YYYYMM'),
+                    month::timestamp AT TIME ZONE 'UTC',
+                    (month + interval '1 month') AT TIME ZONE 'UTC'
+                );
+            END LOOP;
+        END
+        $$
+        """
+    )
+    op.execute(
+        f"""
+        INSERT INTO messages ({COLUMNS})
+        SELECT id, content, room_id, user_id, message_type,
+               coalesce(created_at, now())
+        FROM messages_legacy
+        """
+    )
+    op.execute("DROP TABLE messages_legacy")
+    # Built after the copy; defined on the parent, so every partition,
+    # including future ones, gets them
+    _create_indexes()
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Partitions already archived to disk are not restored
+    _drop_indexes()
+    op.execute("ALTER TABLE messages RENAME TO messages_partitioned")
+    op.execute(
+        "ALTER TABLE messages_partitioned "
+        "RENAME CONSTRAINT messages_pkey TO messages_partitioned_pkey"
+    )
+    op.execute("ALTER TABLE messages_partitioned ALTER COLUMN id DROP DEFAULT")
+    op.execute("ALTER SEQUENCE messages_id_seq OWNED BY NONE")
+    op.execute(
+        """
+        CREATE TABLE messages (
+            id integer NOT NULL DEFAULT nextval('messages_id_seq'),
+            content text NOT NULL,
+            room_id integer NOT NULL REFERENCES chat_rooms (id),
+            user_id integer NOT NULL REFERENCES users (id),
+            message_type varchar(20),
+            created_at timestamptz DEFAULT now(),
+            search_vector tsvector
+                GENERATED ALWAYS AS (to_tsvector('simple', content)) STORED,
+            CONSTRAINT messages_pkey PRIMARY KEY (id)
+        )
+        """
+    )
+    op.execute("ALTER SEQUENCE messages_id_seq OWNED BY messages.id")
+    op.execute(
+        f"""
+        INSERT INTO messages ({COLUMNS})
+        SELECT {COLUMNS} FROM messages_partitioned
+        """
+    )
+    op.execute("DROP TABLE messages_partitioned")
+    _create_indexes()
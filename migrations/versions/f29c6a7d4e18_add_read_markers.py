@@ -0,0 +1,44 @@
+"""add read markers
+
+Revision ID: f29c6a7d4e18
+Revises: d4a8e1f6c250
+Create Date: 2026-10-16 13:48:12.930551
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f29c6a7d4e18'
+down_revision: Union[str, None] = 'd4a8e1f6c250'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Nullable without a default: metadata-only on every partition.
+    # Messages stored before this have no sequence and never count as
+    # unread.
+    op.add_column('messages', sa.Column('seq', sa.BigInteger(), nullable=True))
+    op.add_column(
+        'chat_participants',
+        sa.Column('last_read_message_id', sa.Integer(), nullable=True)
+    )
+    op.add_column(
+        'chat_participants',
+        sa.Column(
+            'last_read_seq', sa.BigInteger(), nullable=False,
+            server_default='0'
+        )
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('chat_participants', 'last_read_seq')
+    op.drop_column('chat_participants', 'last_read_message_id')
+    op.drop_column('messages', 'seq')
@@ -1,4 +1,6 @@
-from fastapi import Depends
+from typing import Optional
+
+from fastapi import Depends, WebSocket, WebSocketException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -6,26 +8,91 @@ from auth.crud import UserDAO
 from auth.execptions import (InvalidTokenException, TokenExpiredException,
                              UserNotFoundException, raise_http_exception)
 from auth.models import User
-from auth.utils import decode_access_token
-from database import get_async_db
+from auth.token_cache import token_cache
+from auth.utils import decode_access_token_claims
+from database import AsyncSessionLocal, get_async_db
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
 
+# Sec-WebSocket-Protocol entry carrying the access token, e.g.
+# "auth.bearer.<jwt>". Never echoed back as the selected subprotocol.
+TOKEN_SUBPROTOCOL_PREFIX = "auth.bearer."
+
+
+async def get_user_from_token(token: str, db: AsyncSession) -> User:
+    """
+    Resolve an access token to its user through the token cache.
+    Raises InvalidTokenException, TokenExpiredException or
+    UserNotFoundException.
+    """
+    user = token_cache.get(token)
+    if user is not None:
+        return user
+    claims = decode_access_token_claims(token)
+    db_user = await UserDAO.get_user_by_email_or_raise(claims["sub"], db)
+    user = User(
+        id=db_user.id,
+        email=db_user.email,
+        username=db_user.username
+    )
+    token_cache.put(token, user, claims["exp"])
+    return user
+
 
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
     db: AsyncSession = Depends(get_async_db)
 ) -> User:
     try:
-        email = decode_access_token(token)
-        db_user = await UserDAO.get_user_by_email_or_raise(email, db)
-        return User(
-            id=db_user.id,
-            email=db_user.email
-        )
+        return await get_user_from_token(token, db)
     except (
         InvalidTokenException,
         TokenExpiredException,
         UserNotFoundException
     ) as e:
         raise_http_exception(e)
+
+
+def get_websocket_token(websocket: WebSocket) -> Optional[str]:
+    """
+    Access token of a WebSocket handshake, from an "auth.bearer.<token>"
+    subprotocol (browsers cannot set headers on WebSockets) or an
+    Authorization: Bearer header. Query strings are not accepted: they
+    end up in access logs and browser history.
+    """
+    for subprotocol in websocket.scope.get("subprotocols", []):
+        if subprotocol.startswith(TOKEN_SUBPROTOCOL_PREFIX):
+            return subprotocol[len(TOKEN_SUBPROTOCOL_PREFIX):] or None
+    authorization = websocket.headers.get("authorization", "")
+    scheme, _, credentials = authorization.partition(" ")
+    if scheme.lower() == "bearer" and credentials:
+        return credentials
+    return None
+
+
+async def get_websocket_user(websocket: WebSocket) -> User:
+    """
+    Authenticate a WebSocket handshake with the same access token as the
+    HTTP API, see get_websocket_token.
+    """
+    token = get_websocket_token(websocket)
+    if token is None:
+        raise WebSocketException(
+            code=status.WS_1008_POLICY_VIOLATION,
+            reason="Not authenticated"
+        )
+    user = token_cache.get(token)
+    if user is not None:
+        return user
+    try:
+        # A short-lived session: the socket may stay open for hours
+        async with AsyncSessionLocal() as db:
+            return await get_user_from_token(token, db)
+    except (
+        InvalidTokenException,
+        TokenExpiredException,
+        UserNotFoundException
+    ) as e:
+        raise WebSocketException(
+            code=status.WS_1008_POLICY_VIOLATION, reason=str(e)
+        )
@@ -11,6 +11,7 @@ class UserCreate(BaseModel):
 class User(BaseModel):
     id: int
     email: EmailStr
+    username: Optional[str] = None
 
     class Config:
         from_attributes = True
@@ -11,6 +11,7 @@ from auth.execptions import (InvalidCredentialsException,
                              UserAlreadyExistsException)
 from auth.models import UserCredentials
 from auth.schema import User as DBUser
+from auth.token_cache import token_cache
 from auth.utils import create_access_token, get_password_hash, verify_password
 
 
@@ -90,4 +91,6 @@ class AuthService:
     async def delete_user_account(user_id: int, db: AsyncSession) -> bool:
         """Delete user account."""
         user = await UserDAO.get_user_by_id_or_raise(user_id, db)
-        return await UserDAO.delete_user(user, db)
+        deleted = await UserDAO.delete_user(user, db)
+        await token_cache.revoke_user(user_id)
+        return deleted
@@ -0,0 +1,121 @@
+"""
+Cache of verified access tokens.
+
+Entries are keyed by the SHA-256 digest of the token, never the token
+itself, and are evicted once the token's exp claim has passed. A hit skips
+both the JWT signature check and the user lookup.
+
+Every worker keeps its own cache, so revocations are published on a Redis
+channel and applied by all of them.
+"""
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from auth.models import User
+from config import settings
+from redis_client import async_redis_client
+
+logger = logging.getLogger(__name__)
+
+REVOCATION_CHANNEL = "auth:token_revocations"
+
+
+class TokenCache:
+    def __init__(
+        self,
+        max_entries: int = settings.auth_token_cache_size,
+        redis=None
+    ):
+        self.max_entries = max_entries
+        self.redis = redis
+        # token digest -> (expires_at, user), oldest first. Every token has
+        # the same lifetime, so this is close to expiry order. An
+        # OrderedDict keeps popping from the front O(1), unlike a dict.
+        self._entries: Dict[bytes, Tuple[float, User]] = OrderedDict()
+        self._listener: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _digest(token: str) -> bytes:
+        return hashlib.sha256(token.encode("utf-8")).digest()
+
+    def get(self, token: str) -> Optional[User]:
+        digest = self._digest(token)
+        entry = self._entries.get(digest)
+        if entry is None:
+            return None
+        if entry[0] <= time.time():
+            del self._entries[digest]
+            return None
+        return entry[1]
+
+    def put(self, token: str, user: User, expires_at: float):
+        if expires_at <= time.time():
+            return
+        if len(self._entries) >= self.max_entries:
+            self._evict()
+        self._entries[self._digest(token)] = (expires_at, user)
+
+    def evict_user(self, user_id: int):
+        """Forget every token of a user, e.g. after the account is deleted"""
+        for digest, (_, user) in list(self._entries.items()):
+            if user.id == user_id:
+                del self._entries[digest]
+
+    async def revoke_user(self, user_id: int):
+        """Forget every token of a user on every worker"""
+        self.evict_user(user_id)
+        if self.redis is None:
+            return
+        try:
+            await self.redis.publish(REVOCATION_CHANNEL, str(user_id))
+        except Exception as e:
+            logger.error(f"Error publishing token revocation of {user_id}: {e}")
+
+    async def start(self):
+        """Start applying revocations published by other workers"""
+        if self.redis is not None and self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+
+    async def _listen(self):
+        while True:
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(REVOCATION_CHANNEL)
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        self.evict_user(int(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Token revocation listener error: {e}")
+                await asyncio.sleep(1)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+
+    def _evict(self):
+        """Drop expired entries from the front, then the oldest if still full"""
+        now = time.time()
+        while self._entries:
+            digest, (expires_at, _) = next(iter(self._entries.items()))
+            if expires_at > now:
+                break
+            del self._entries[digest]
+        if len(self._entries) >= self.max_entries:
+            self._entries.popitem(last=False)
+
+
+# Global token cache instance shared by HTTP and WebSocket authentication
+token_cache = TokenCache(redis=async_redis_client)
@@ -38,21 +38,28 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
     return encoded_jwt
 
 
-def decode_access_token(token: str) -> str:
+def decode_access_token_claims(token: str) -> dict:
     """
-    Decode JWT token and return email.
+    Verify a JWT token and return its claims.
     Raises InvalidTokenException or TokenExpiredException.
     """
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise InvalidTokenException()
-        return email
     except jwt.ExpiredSignatureError:
         raise TokenExpiredException()
     except JWTError:
         raise InvalidTokenException()
+    if payload.get("sub") is None or payload.get("exp") is None:
+        raise InvalidTokenException()
+    return payload
+
+
+def decode_access_token(token: str) -> str:
+    """
+    Decode JWT token and return email.
+    Raises InvalidTokenException or TokenExpiredException.
+    """
+    return decode_access_token_claims(token)["sub"]
 
 
 def validate_token(token: str) -> bool:
@@ -31,6 +31,11 @@ celery_app.conf.beat_schedule = {
         'schedule': 86400.0,  # Run every 86400 seconds (24 hours / everyday)
         'args': [None]  # Use default URLs
     },
+    # Keep monthly message partitions ahead and archive old months
+    'maintain-message-partitions': {
+        'task': 'celery_tasks.maintain_message_partitions',
+        'schedule': 86400.0,
+    },
     # Example periodic task (commented out)
     'periodic-task': {
         'task': 'celery_tasks.example_task',
@@ -5,6 +5,8 @@ import time
 import logging
 from tasks.tasks import add_random_task, add_multiple_random_tasks
 from tasks.daily_fetch import daily_fetch_task
+from chat.partitions import archive_partitions, ensure_partitions
+from database import sync_engine
 
 logger = logging.getLogger(__name__)
 
@@ -99,3 +101,19 @@ def daily_website_fetch(urls=None):
         logger.error(f"Error in daily fetch task: {e}")
         return {"error": str(e), "task": "daily_website_fetch"}
 
+
+@celery_app.task
+def maintain_message_partitions():
+    """Create upcoming message partitions and archive expired ones"""
+    try:
+        with sync_engine.begin() as connection:
+            created = ensure_partitions(connection)
+        archived = archive_partitions(sync_engine)
+        logger.info(
+            f"Message partitions: created {created}, "
+            f"archived {[entry['partition'] for entry in archived]}"
+        )
+        return {"created": created, "archived": archived}
+    except Exception as e:
+        logger.error(f"Error maintaining message partitions: {e}")
+        return {"error": str(e), "task": "maintain_message_partitions"}
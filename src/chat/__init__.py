@@ -6,19 +6,48 @@ This module provides:
 - Chat room management
 - Message persistence
 - User presence tracking
+
+The exports below are imported on first access, so importing a
+submodule (chat.partitions from Celery, chat.schema from Alembic) does
+not load the FastAPI app, Redis clients and the connection managers.
 """
+import importlib
 
-from .api import router
-from .models import ChatRoom as ChatRoomSchema
-from .models import ChatRoomCreate, ChatRoomUpdate
-from .models import Message as MessageSchema
-from .models import MessageCreate, RoomWithMessages, WebSocketMessage
-from .schema import ChatParticipant, ChatRoom, Message
-from .websocket_manager import manager
+# Exported name -> (submodule, attribute)
+_EXPORTS = {
+    "router": ("api", "router"),
+    "ChatRoomSchema": ("models", "ChatRoom"),
+    "ChatRoomCreate": ("models", "ChatRoomCreate"),
+    "ChatRoomPage": ("models", "ChatRoomPage"),
+    "ChatRoomSummary": ("models", "ChatRoomSummary"),
+    "ChatRoomUpdate": ("models", "ChatRoomUpdate"),
+    "MessageSchema": ("models", "Message"),
+    "MessageCreate": ("models", "MessageCreate"),
+    "MessagePage": ("models", "MessagePage"),
+    "MessageSearchHit": ("models", "MessageSearchHit"),
+    "MessageSearchPage": ("models", "MessageSearchPage"),
+    "RoomWithMessages": ("models", "RoomWithMessages"),
+    "WebSocketMessage": ("models", "WebSocketMessage"),
+    "ChatParticipant": ("schema", "ChatParticipant"),
+    "ChatRoom": ("schema", "ChatRoom"),
+    "Message": ("schema", "Message"),
+    "manager": ("websocket_manager", "manager"),
+}
 
 __all__ = [
     "ChatRoom", "Message", "ChatParticipant",
-    "ChatRoomCreate", "ChatRoomUpdate", "ChatRoomSchema",
+    "ChatRoomCreate", "ChatRoomUpdate", "ChatRoomSchema", "ChatRoomSummary",
+    "ChatRoomPage",
     "MessageCreate", "MessageSchema", "WebSocketMessage", "RoomWithMessages",
+    "MessagePage", "MessageSearchHit", "MessageSearchPage",
     "manager", "router"
 ]
+
+
+def __getattr__(name: str):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module_name, attribute = _EXPORTS[name]
+    value = getattr(importlib.import_module(f".{module_name}", __name__), attribute)
+    globals()[name] = value
+    return value
@@ -1,29 +1,41 @@
-import json
 import logging
 import uuid
-from datetime import datetime
 from pathlib import Path
-from typing import List
+from typing import Optional, Tuple
 
-from fastapi import (APIRouter, Depends, HTTPException, Request, WebSocket,
-                     WebSocketDisconnect)
-from fastapi.responses import HTMLResponse
+from fastapi import (APIRouter, Depends, HTTPException, Query, Request,
+                     WebSocket, WebSocketDisconnect, WebSocketException,
+                     status)
+from fastapi.responses import HTMLResponse, PlainTextResponse
 from fastapi.templating import Jinja2Templates
-from sqlalchemy import select
+from sqlalchemy import select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
 from auth.api import get_current_user
+from auth.dependencies import get_websocket_user
 from auth.models import User
-from database import get_async_db
+from config import settings
+from database import AsyncSessionLocal, get_async_db
 
+from .audio_format import AudioFormat
+from .codec import CodecError
+from .crud import MessageCRUD
+from .membership import membership_cache
 from .models import ChatRoom as ChatRoomSchema
-from .models import ChatRoomCreate
+from .models import (ChatRoomBatching, ChatRoomCreate, ChatRoomPage,
+                     ChatRoomSummary)
 from .models import Message as MessageSchema
-from .models import MessageCreate, RoomWithMessages
-from .schema import ChatParticipant, ChatRoom, Message
+from .models import (MessageCreate, MessagePage, MessageSearchPage,
+                     RoomWithMessages, check_message_content)
+from .persistence import WriterOverloadedError, message_writer
+from .rate_limit import rate_limiter
+from .read_markers import read_markers, room_sequences
+from .schema import ChatParticipant, ChatRoom
 from .websocket_manager import manager
-from .voice_chat import voice_manager
+from .voice_chat import negotiate_audio_protocol, voice_manager
+from .voice_metrics import voice_metrics
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/chat")
@@ -58,7 +70,8 @@ async def create_chat_room(
     room = ChatRoom(
         name=room_data.name,
         description=room_data.description,
-        is_public=room_data.is_public
+        is_public=room_data.is_public,
+        member_count=1
     )
     db.add(room)
     await db.commit()
@@ -70,26 +83,99 @@ async def create_chat_room(
     )
     db.add(participant)
     await db.commit()
+    await membership_cache.add(current_user.id, room.id)
 
     return room
 
 
-@router.get("/rooms", response_model=List[ChatRoomSchema])
+@router.get("/rooms", response_model=ChatRoomPage)
 async def get_chat_rooms(
+    q: Optional[str] = Query(
+        None, min_length=1, max_length=100,
+        description="Only rooms whose name contains this text"
+    ),
+    before: Optional[int] = Query(
+        None, description="Return rooms listed after this room id"
+    ),
+    limit: int = Query(settings.chat_room_page_size, ge=1, le=200),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_async_db)
 ):
+    """List visible rooms with their summaries, newest first"""
+    room_ids = await membership_cache.get_rooms(
+        db, current_user.id, shared=True
+    )
     stmt = select(ChatRoom).where(
         (ChatRoom.is_public.is_(True)) |
-        (ChatRoom.id.in_(
-            select(ChatParticipant.room_id).where(
-                ChatParticipant.user_id == current_user.id
-            )
-        ))
-    ).order_by(ChatRoom.created_at.desc())
+        (ChatRoom.id.in_(room_ids))
+    )
+    if q is not None:
+        # Escape LIKE wildcards; the trigram index serves the match
+        pattern = (
+            q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        )
+        stmt = stmt.where(ChatRoom.name.ilike(f"%{pattern}%"))
+    if before is not None:
+        cursor_created_at = await db.scalar(
+            select(ChatRoom.created_at).where(ChatRoom.id == before)
+        )
+        if cursor_created_at is None:
+            raise HTTPException(status_code=404, detail="Cursor room not found")
+        stmt = stmt.where(
+            tuple_(ChatRoom.created_at, ChatRoom.id) <
+            tuple_(cursor_created_at, before)
+        )
+    stmt = stmt.order_by(
+        ChatRoom.created_at.desc(), ChatRoom.id.desc()
+    ).limit(limit + 1)
     result = await db.execute(stmt)
-    rooms = result.scalars().all()
-    return rooms
+    rooms = list(result.scalars().all())
+    has_more = len(rooms) > limit
+    rooms = rooms[:limit]
+
+    # Unread counts: one query for the markers, one MGET for the sequences
+    markers_result = await db.execute(
+        select(
+            ChatParticipant.room_id,
+            ChatParticipant.last_read_message_id,
+            ChatParticipant.last_read_seq
+        ).where(
+            ChatParticipant.user_id == current_user.id,
+            ChatParticipant.room_id.in_([room.id for room in rooms])
+        )
+    )
+    markers = {
+        room_id: (message_id, seq)
+        for room_id, message_id, seq in markers_result.all()
+    }
+    sequences = await room_sequences.current(list(markers))
+    summaries = []
+    for room in rooms:
+        summary = ChatRoomSummary.model_validate(room)
+        if room.id in markers:
+            message_id, read_seq = markers[room.id]
+            pending_seq = read_markers.pending_seq(room.id, current_user.id)
+            if pending_seq is not None:
+                read_seq = max(read_seq, pending_seq)
+            summary.unread_count = max(0, sequences[room.id] - read_seq)
+            summary.last_read_message_id = message_id
+        summaries.append(summary)
+    return {"rooms": summaries, "has_more": has_more}
+
+
+async def _get_accessible_room(
+    room_id: int, current_user: User, db: AsyncSession, *options
+) -> ChatRoom:
+    stmt = select(ChatRoom).options(*options).where(ChatRoom.id == room_id)
+    result = await db.execute(stmt)
+    room = result.scalar_one_or_none()
+    if not room:
+        raise HTTPException(status_code=404, detail="Chat room not found")
+    if not room.is_public and not await membership_cache.is_member(
+        db, current_user.id, room_id
+    ):
+        raise HTTPException(status_code=403, detail="Access denied")
+    return room
 
 
 @router.get("/rooms/{room_id}", response_model=RoomWithMessages)
@@ -98,24 +184,83 @@ async def get_chat_room(
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_async_db)
 ):
-    stmt = select(ChatRoom).options(
-        selectinload(ChatRoom.messages),
-        selectinload(ChatRoom.participants)
-    ).where(ChatRoom.id == room_id)
-    result = await db.execute(stmt)
-    room = result.scalar_one_or_none()
-    if not room:
-        raise HTTPException(status_code=404, detail="Chat room not found")
-    if not room.is_public:
-        participant_stmt = select(ChatParticipant).where(
-            ChatParticipant.room_id == room_id,
-            ChatParticipant.user_id == current_user.id
-        )
-        participant_result = await db.execute(participant_stmt)
-        if not participant_result.scalar_one_or_none():
-            raise HTTPException(status_code=403, detail="Access denied")
+    """Get a chat room with its most recent page of messages"""
+    room = await _get_accessible_room(
+        room_id, current_user, db, selectinload(ChatRoom.participants)
+    )
+    messages, has_more, has_older = await MessageCRUD.get_message_page(
+        db, room_id, limit=settings.chat_history_page_size
+    )
+    return RoomWithMessages.model_validate({
+        **ChatRoomSchema.model_validate(room).model_dump(),
+        "messages": messages,
+        "has_more_messages": has_more or has_older,
+        "participants": room.participants
+    }, from_attributes=True)
 
-    return room
+
+@router.get("/rooms/{room_id}/messages", response_model=MessagePage)
+async def get_room_messages(
+    room_id: int,
+    before: Optional[int] = Query(
+        None, description="Return messages older than this message id"
+    ),
+    after: Optional[int] = Query(
+        None, description="Return messages newer than this message id"
+    ),
+    limit: int = Query(
+        settings.chat_history_page_size, ge=1, le=200,
+        description="Maximum number of messages to return"
+    ),
+    include_older: bool = Query(
+        False,
+        description=(
+            "Also read messages older than the hot window "
+            f"({settings.chat_history_hot_months} months)"
+        )
+    ),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get a page of a room's message history"""
+    await _get_accessible_room(room_id, current_user, db)
+    messages, has_more, has_older = await MessageCRUD.get_message_page(
+        db, room_id, before=before, after=after, limit=limit,
+        include_older=include_older
+    )
+    return {"messages": messages, "has_more": has_more, "has_older": has_older}
+
+
+@router.get("/search", response_model=MessageSearchPage)
+async def search_messages(
+    q: str = Query(..., min_length=1, max_length=200, description="Search terms"),
+    room_id: Optional[int] = Query(
+        None, description="Only search this room"
+    ),
+    limit: int = Query(settings.chat_search_page_size, ge=1, le=100),
+    cursor: Optional[str] = Query(
+        None, description="next_cursor of the previous page"
+    ),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Search messages in the rooms the current user participates in"""
+    if room_id is None:
+        room_ids = await membership_cache.get_rooms(
+            db, current_user.id, shared=True
+        )
+    elif await membership_cache.is_member(db, current_user.id, room_id):
+        room_ids = [room_id]
+    else:
+        raise HTTPException(
+            status_code=403,
+            detail="Not a participant in this room"
+        )
+    hits, next_cursor = await MessageCRUD.search_messages(
+        db, room_ids, q, limit=limit, cursor=cursor,
+        candidate_limit=settings.chat_search_candidate_limit
+    )
+    return {"results": hits, "next_cursor": next_cursor}
 
 
 @router.post("/rooms/{room_id}/join")
@@ -134,113 +279,285 @@ async def join_chat_room(
         raise HTTPException(status_code=404, detail="Chat room not found")
     
     # Check if already a participant
-    participant_stmt = select(ChatParticipant).where(
-        ChatParticipant.room_id == room_id,
-        ChatParticipant.user_id == current_user.id
-    )
-    participant_result = await db.execute(participant_stmt)
-    existing_participant = participant_result.scalar_one_or_none()
-    
-    if existing_participant:
+    if await membership_cache.is_member(db, current_user.id, room_id):
         return {"message": "Already a participant in this room"}
     
-    # Add as participant
-    participant = ChatParticipant(
+    # Add as participant; a concurrent join of the same user is a no-op.
+    # Earlier history doesn't count as unread.
+    sequences = await room_sequences.current([room_id])
+    participant_stmt = insert(ChatParticipant).values(
         room_id=room_id,
         user_id=current_user.id,
-        is_admin=False
-    )
-    db.add(participant)
+        is_admin=False,
+        last_read_seq=sequences[room_id]
+    ).on_conflict_do_nothing(index_elements=["room_id", "user_id"])
+    result = await db.execute(participant_stmt)
+    if result.rowcount:
+        await db.execute(
+            update(ChatRoom)
+            .where(ChatRoom.id == room_id)
+            .values(
+                member_count=ChatRoom.member_count + 1,
+                updated_at=ChatRoom.updated_at
+            )
+        )
     await db.commit()
-    
+    await membership_cache.add(current_user.id, room_id)
+
+    if result.rowcount == 0:
+        return {"message": "Already a participant in this room"}
     return {"message": "Successfully joined the chat room"}
 
 
-@router.post("/rooms/{room_id}/messages", response_model=MessageSchema)
-async def create_message(
+@router.put("/rooms/{room_id}/batching", response_model=ChatRoomSchema)
+async def set_room_batching(
     room_id: int,
-    message_data: MessageCreate,
+    batching: ChatRoomBatching,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_async_db)
 ):
-    """Create a new message in a chat room"""
-    # Check if user is participant
-    participant_stmt = select(ChatParticipant).where(
-        ChatParticipant.room_id == room_id,
-        ChatParticipant.user_id == current_user.id
-    )
-    participant_result = await db.execute(participant_stmt)
-    if not participant_result.scalar_one_or_none():
+    """
+    Turn micro-batching of outbound frames on or off for a room.
+    Broadcasts are collected for window_ms and sent as one "batch" frame
+    per recipient. Only room admins may change it.
+    """
+    window_ms = batching.window_ms
+    if window_ms is not None and not (
+        0 < window_ms <= settings.chat_batch_max_window_ms
+    ):
         raise HTTPException(
-            status_code=403,
-            detail="Not a participant in this room"
+            status_code=400,
+            detail=(
+                "window_ms must be between 1 and "
+                f"{settings.chat_batch_max_window_ms}"
+            )
+        )
+    room = await db.get(ChatRoom, room_id)
+    if not room:
+        raise HTTPException(status_code=404, detail="Chat room not found")
+    is_admin = await db.scalar(
+        select(ChatParticipant.is_admin).where(
+            ChatParticipant.room_id == room_id,
+            ChatParticipant.user_id == current_user.id
         )
-    message = Message(
-        content=message_data.content,
-        room_id=room_id,
-        user_id=current_user.id,
-        message_type=message_data.message_type
     )
-    db.add(message)
+    if not is_admin:
+        raise HTTPException(status_code=403, detail="Room admins only")
+    room.batch_window_ms = window_ms
     await db.commit()
-    await db.refresh(message)
+    await db.refresh(room)
+    manager.set_batch_window(room_id, window_ms)
+    return room
+
+
+# Largest values of the messages.id (INTEGER) and seq (BIGINT) columns
+MAX_MESSAGE_ID = 2**31 - 1
+MAX_SEQ = 2**63 - 1
+
+
+def _is_id(value, maximum: int = MAX_MESSAGE_ID) -> bool:
+    """True for an int a positive id column can hold"""
+    return (
+        isinstance(value, int) and not isinstance(value, bool)
+        and 0 < value <= maximum
+    )
+
 
+async def _post_message(
+    room_id: int,
+    user_id: int,
+    username: str,
+    content: str,
+    message_type: str = "text"
+) -> dict:
+    """Number, queue for storage and broadcast a message; returns the row"""
+    # Before taking a sequence number, so a refused post leaves no gap
+    message_writer.ensure_capacity()
+    seq = await room_sequences.next(room_id)
+    # Stored in the background; broadcast right away
+    message = await message_writer.create(
+        room_id=room_id,
+        user_id=user_id,
+        content=content,
+        message_type=message_type,
+        seq=seq
+    )
+    # Senders have read their own messages
+    read_markers.mark(room_id, user_id, message["id"], seq)
     await manager.broadcast_to_room(room_id, {
         "type": "message",
-        "content": message.content,
-        "user_id": current_user.id,
-        "username": current_user.username,
-        "message_id": message.id,
-        "message_type": message.message_type,
-        "timestamp": message.created_at.isoformat()
+        "content": content,
+        "user_id": user_id,
+        "username": username,
+        "message_id": message["id"],
+        "seq": seq,
+        "message_type": message["message_type"],
+        "timestamp": message["created_at"].isoformat()
     })
-    
     return message
 
 
+async def _get_websocket_room(room_id: int, user_id: int) -> Tuple[bool, Optional[int]]:
+    """
+    Check that a room exists and the user may join it; returns whether
+    the room is public and its stored batching setting
+    """
+    async with AsyncSessionLocal() as db:
+        room = (await db.execute(
+            select(ChatRoom.is_public, ChatRoom.batch_window_ms)
+            .where(ChatRoom.id == room_id)
+        )).one_or_none()
+        if room is None:
+            raise WebSocketException(
+                code=status.WS_1008_POLICY_VIOLATION,
+                reason="Chat room not found"
+            )
+        if not room.is_public and not await membership_cache.is_member(
+            db, user_id, room_id
+        ):
+            raise WebSocketException(
+                code=status.WS_1008_POLICY_VIOLATION, reason="Access denied"
+            )
+    return room.is_public, room.batch_window_ms
+
+
+async def _can_post(room_id: int, user_id: int, is_public: bool) -> bool:
+    """Re-checked per post, as members can leave while connected"""
+    if is_public:
+        return True
+    async with AsyncSessionLocal() as db:
+        return await membership_cache.is_member(db, user_id, room_id)
+
+
+@router.post("/rooms/{room_id}/messages", response_model=MessageSchema)
+async def create_message(
+    room_id: int,
+    message_data: MessageCreate,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Create a new message in a chat room"""
+    # Check if user is participant
+    if not await membership_cache.is_member(db, current_user.id, room_id):
+        raise HTTPException(
+            status_code=403,
+            detail="Not a participant in this room"
+        )
+    try:
+        return await _post_message(
+            room_id,
+            current_user.id,
+            current_user.username,
+            message_data.content,
+            message_data.message_type
+        )
+    except WriterOverloadedError:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many messages waiting to be saved, retry later"
+        )
+
+
 # WebSocket endpoint
 @router.websocket("/ws/{room_id}")
 async def websocket_endpoint(
     websocket: WebSocket,
     room_id: int,
-    user_id: int,
-    username: str
+    last_message_id: Optional[int] = None,
+    current_user: User = Depends(get_websocket_user)
 ):
-    """WebSocket endpoint for real-time chat"""
-    await manager.connect(websocket, room_id, user_id, username)
+    """
+    WebSocket endpoint for real-time chat, authenticated with an
+    "auth.bearer.<token>" subprotocol next to the codec's subprotocol.
+    Pass last_message_id when reconnecting to replay missed messages.
+    """
+    user_id = current_user.id
+    username = current_user.username
+    is_public, batch_window_ms = await _get_websocket_room(room_id, user_id)
+    await manager.connect(
+        websocket, room_id, user_id, username, last_message_id,
+        batch_window_ms=batch_window_ms
+    )
+    limit = rate_limiter.open(user_id)
     try:
         while True:
-            data = await websocket.receive_text()
             try:
-                message_data = json.loads(data)
+                message_data = await manager.receive_message(websocket)
+
+                retry_after = await rate_limiter.check(
+                    limit, message_data.get("type")
+                )
+                if retry_after:
+                    if rate_limiter.should_disconnect(limit):
+                        logger.warning(
+                            f"Disconnecting user {user_id} from room "
+                            f"{room_id} for exceeding the rate limit"
+                        )
+                        # 1008: policy violation
+                        await manager.close(websocket, code=1008)
+                        break
+                    await manager.send_personal_message({
+                        "type": "error",
+                        "code": "rate_limited",
+                        "message": "Too many messages, slow down",
+                        "retry_after": round(retry_after, 3)
+                    }, websocket)
+                    continue
                 
                 if message_data.get("type") == "message":
-                    # Broadcast the message to all users in the room
-                    await manager.broadcast_to_room(room_id, {
-                        "type": "message",
-                        "content": message_data.get("content"),
-                        "user_id": user_id,
-                        "username": username,
-                        "timestamp": datetime.now().isoformat()
-                    })
+                    content = message_data.get("content")
+                    if not isinstance(content, str):
+                        raise CodecError("Message content must be text")
+                    try:
+                        check_message_content(content)
+                    except ValueError as e:
+                        raise CodecError(str(e))
+                    if not await _can_post(room_id, user_id, is_public):
+                        logger.warning(
+                            f"Disconnecting user {user_id} from room "
+                            f"{room_id}: no longer a participant"
+                        )
+                        await manager.close(websocket, code=1008)
+                        break
+                    try:
+                        await _post_message(room_id, user_id, username, content)
+                    except WriterOverloadedError:
+                        await manager.send_personal_message({
+                            "type": "error",
+                            "code": "overloaded",
+                            "message": "Message not sent, retry later"
+                        }, websocket)
                 
                 elif message_data.get("type") == "typing":
-                    # Broadcast typing indicator (exclude sender)
-                    await manager.broadcast_to_room(room_id, {
-                        "type": "typing",
-                        "user_id": user_id,
-                        "username": username,
-                        "is_typing": message_data.get("is_typing", False)
-                    }, exclude_user=user_id)
+                    # Coalesced with other typing states in the room
+                    manager.set_typing(
+                        room_id, user_id, username,
+                        bool(message_data.get("is_typing", False))
+                    )
+
+                elif message_data.get("type") == "read":
+                    # {"type": "read", "message_id": ..., "seq": ...} from
+                    # the last message frame the client displayed
+                    message_id = message_data.get("message_id")
+                    seq = message_data.get("seq")
+                    if not _is_id(message_id) or not _is_id(seq, MAX_SEQ):
+                        raise CodecError("Read marker needs message_id and seq")
+                    # A marker past the room's newest message would hide
+                    # every later message from the unread count
+                    current = (await room_sequences.current([room_id]))[room_id]
+                    read_markers.mark(room_id, user_id, message_id, min(seq, current))
                     
-            except json.JSONDecodeError:
-                logger.error(f"Invalid JSON received from user {user_id}")
-                await websocket.send_text(json.dumps({
+            except CodecError:
+                logger.error(f"Invalid frame received from user {user_id}")
+                await manager.send_personal_message({
                     "type": "error",
                     "message": "Invalid message format"
-                }))
+                }, websocket)
                 
     except WebSocketDisconnect:
+        pass
+    finally:
+        rate_limiter.close(limit)
         manager.disconnect(websocket)
 
 
@@ -256,12 +573,10 @@ async def get_room_users(
 
 @router.get("/stats")
 async def get_chat_stats():
-    """Get chat statistics"""
-    total_connections = manager.get_connection_count()
-    return {
-        "total_connections": total_connections,
-        "active_rooms": len(manager.active_connections)
-    }
+    """Get chat statistics for this worker"""
+    stats = manager.get_stats()
+    stats["rate_limits"] = rate_limiter.get_stats()
+    return stats
 
 
 # Voice Chat endpoints
@@ -269,17 +584,39 @@ async def get_chat_stats():
 async def voice_chat_endpoint(
     websocket: WebSocket,
     room_id: int,
-    user_id: int
+    input_format: Optional[str] = Query(None),
+    output_format: Optional[str] = Query(None),
+    current_user: User = Depends(get_websocket_user)
 ):
-    """WebSocket endpoint for voice chat with OpenAI Realtime API"""
-    await websocket.accept()
+    """
+    WebSocket endpoint for voice chat with OpenAI Realtime API.
+    Offer the "voice.pcm16" subprotocol to send and receive audio as
+    binary frames instead of base64 JSON events. input_format and
+    output_format ("<s16|f32>:<rate>:<channels>", e.g. "f32:48000:2")
+    select the client's audio format; the default is s16:24000:1.
+    """
+    user_id = current_user.id
+    try:
+        client_input = AudioFormat.parse(input_format)
+        client_output = AudioFormat.parse(output_format)
+    except ValueError as e:
+        raise WebSocketException(
+            code=status.WS_1003_UNSUPPORTED_DATA, reason=str(e)
+        )
+    binary_audio, subprotocol = negotiate_audio_protocol(
+        websocket.scope.get("subprotocols", [])
+    )
+    await websocket.accept(subprotocol=subprotocol)
     
     # Generate unique session ID
     session_id = f"voice_{room_id}_{user_id}_{uuid.uuid4().hex[:8]}"
     
     try:
         # Start voice session
-        await voice_manager.start_voice_session(websocket, session_id, user_id)
+        await voice_manager.start_voice_session(
+            websocket, session_id, user_id, binary_audio,
+            client_input, client_output
+        )
     except WebSocketDisconnect:
         logger.info(f"Voice chat disconnected for user {user_id} in room {room_id}")
     except Exception as e:
@@ -293,9 +630,21 @@ async def voice_chat_endpoint(
 async def get_active_voice_sessions(
     current_user: User = Depends(get_current_user)
 ):
-    """Get active voice chat sessions"""
+    """Get active voice chat sessions with their latency and throughput"""
     sessions = voice_manager.get_active_sessions()
-    return {"active_sessions": sessions}
+    return {
+        "active_sessions": sessions,
+        "connection_pool": voice_manager.pool.get_stats()
+    }
+
+
+@router.get("/voice/metrics", response_class=PlainTextResponse)
+async def get_voice_metrics():
+    """Voice latency histograms and counters of this worker, for Prometheus"""
+    return PlainTextResponse(
+        voice_metrics.render(),
+        media_type="text/plain; version=0.0.4"
+    )
 
 
 @router.post("/voice/sessions/{session_id}/end")
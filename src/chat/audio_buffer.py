@@ -0,0 +1,119 @@
+"""
+Coalescing of inbound voice audio.
+
+Clients send audio in whatever chunk sizes their capture API produces,
+often a few milliseconds each. Forwarding every chunk as its own
+input_audio_buffer.append event floods the Realtime API connection, so
+chunks are copied into a preallocated buffer and sent upstream one frame
+(e.g. 100 ms) at a time, or earlier when the oldest buffered audio has
+waited max_delay.
+"""
+import asyncio
+import base64
+import logging
+from typing import Awaitable, Callable, Dict, Optional
+
+from config import settings
+
+from .audio_format import REALTIME_FORMAT
+
+logger = logging.getLogger(__name__)
+
+INPUT_SAMPLE_RATE = REALTIME_FORMAT.sample_rate
+SAMPLE_WIDTH = REALTIME_FORMAT.frame_size
+
+
+def frame_bytes(frame_ms: int, sample_rate: int = INPUT_SAMPLE_RATE) -> int:
+    """Bytes of mono PCM16 in frame_ms, rounded down to whole samples"""
+    return max(1, sample_rate * frame_ms // 1000) * SAMPLE_WIDTH
+
+
+class AudioInputBuffer:
+    """Groups one session's PCM16 chunks into frames before appending"""
+
+    def __init__(
+        self,
+        append: Callable[[str], Awaitable[None]],
+        frame_size: int = frame_bytes(settings.voice_input_frame_ms),
+        max_delay: float = settings.voice_input_max_delay_ms / 1000
+    ):
+        # append takes a frame as base64, like input_audio_buffer.append
+        self._append = append
+        self._buffer = bytearray(frame_size)
+        self._fill = 0
+        self.max_delay = max_delay
+        self._deadline: Optional[asyncio.TimerHandle] = None
+        # Keeps appends in order when the deadline and a write race
+        self._lock = asyncio.Lock()
+        self.counters: Dict[str, int] = {
+            "chunks_in": 0,
+            "bytes_in": 0,
+            "appends_out": 0,
+            "bytes_out": 0,
+            "deadline_flushes": 0
+        }
+
+    @property
+    def buffered(self) -> int:
+        return self._fill
+
+    async def write(self, chunk):
+        """Buffer a chunk of PCM16, sending every frame it completes"""
+        view = memoryview(chunk).cast("B")
+        self.counters["chunks_in"] += 1
+        self.counters["bytes_in"] += len(view)
+        async with self._lock:
+            capacity = len(self._buffer)
+            while view:
+                taken = min(capacity - self._fill, len(view))
+                self._buffer[self._fill:self._fill + taken] = view[:taken]
+                self._fill += taken
+                view = view[taken:]
+                if self._fill == capacity:
+                    await self._send()
+            if self._fill and self._deadline is None:
+                self._deadline = asyncio.get_running_loop().call_later(
+                    self.max_delay, self._on_deadline
+                )
+
+    async def flush(self):
+        """Send whatever is buffered now, e.g. before a commit"""
+        async with self._lock:
+            await self._send()
+
+    def close(self):
+        """Drop buffered audio and stop the deadline timer"""
+        self._cancel_deadline()
+        self._fill = 0
+
+    def _on_deadline(self):
+        self._deadline = None
+        if self._fill:
+            self.counters["deadline_flushes"] += 1
+            asyncio.create_task(self._flush_on_deadline())
+
+    async def _flush_on_deadline(self):
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Error flushing buffered voice audio: {e}")
+
+    async def _send(self):
+        self._cancel_deadline()
+        if not self._fill:
+            return
+        audio = base64.b64encode(
+            memoryview(self._buffer)[:self._fill]
+        ).decode("ascii")
+        self.counters["appends_out"] += 1
+        self.counters["bytes_out"] += self._fill
+        self._fill = 0
+        await self._append(audio)
+
+    def _cancel_deadline(self):
+        if self._deadline is not None:
+            self._deadline.cancel()
+            self._deadline = None
+
+    def get_stats(self) -> Dict:
+        return {**self.counters, "buffered_bytes": self._fill}
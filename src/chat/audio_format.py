@@ -0,0 +1,166 @@
+"""
+Audio format negotiation and conversion for voice sessions.
+
+The Realtime API takes and returns 24 kHz mono PCM16. Clients may instead
+ask for their capture/playback format, e.g. 48 kHz float32 stereo, with
+"<encoding>:<rate>:<channels>" strings such as "f32:48000:2". Audio is
+downmixed to mono, resampled with a polyphase FIR filter whose state is
+carried from chunk to chunk, and re-encoded, all vectorized with NumPy.
+"""
+import math
+from typing import Optional
+
+import numpy as np
+
+ENCODINGS = {"s16": np.dtype("<i2"), "f32": np.dtype("<f4")}
+SAMPLE_RATES = (16000, 24000, 44100, 48000)
+MAX_CHANNELS = 2
+PCM16_SCALE = 32768.0
+
+
+class AudioFormat:
+    """Sample encoding, rate and channel count of a PCM stream"""
+
+    __slots__ = ("encoding", "sample_rate", "channels")
+
+    def __init__(self, encoding: str, sample_rate: int, channels: int):
+        if encoding not in ENCODINGS:
+            raise ValueError(f"Unsupported sample encoding {encoding!r}")
+        if sample_rate not in SAMPLE_RATES:
+            raise ValueError(f"Unsupported sample rate {sample_rate}")
+        if not 1 <= channels <= MAX_CHANNELS:
+            raise ValueError(f"Unsupported channel count {channels}")
+        self.encoding = encoding
+        self.sample_rate = sample_rate
+        self.channels = channels
+
+    @classmethod
+    def parse(cls, spec: Optional[str]) -> "AudioFormat":
+        """Parse "s16:24000:1"; None or "" is the Realtime API's format"""
+        if not spec:
+            return REALTIME_FORMAT
+        parts = spec.split(":")
+        if len(parts) != 3 or not parts[1].isdigit() or not parts[2].isdigit():
+            raise ValueError(f"Invalid audio format {spec!r}")
+        return cls(parts[0], int(parts[1]), int(parts[2]))
+
+    @property
+    def dtype(self) -> np.dtype:
+        return ENCODINGS[self.encoding]
+
+    @property
+    def frame_size(self) -> int:
+        """Bytes per sample frame (one sample of every channel)"""
+        return self.dtype.itemsize * self.channels
+
+    def __eq__(self, other) -> bool:
+        return (
+            isinstance(other, AudioFormat)
+            and self.encoding == other.encoding
+            and self.sample_rate == other.sample_rate
+            and self.channels == other.channels
+        )
+
+    def __hash__(self) -> int:
+        return hash((self.encoding, self.sample_rate, self.channels))
+
+    def __str__(self) -> str:
+        return f"{self.encoding}:{self.sample_rate}:{self.channels}"
+
+
+# The Realtime API's pcm16 format
+REALTIME_FORMAT = AudioFormat("s16", 24000, 1)
+
+
+def design_lowpass(
+    up: int,
+    down: int,
+    taps_per_phase: int = 24,
+    beta: float = 8.0
+) -> np.ndarray:
+    """
+    Kaiser-windowed sinc lowpass for resampling by up/down, laid out as a
+    (up, taps_per_phase) polyphase matrix with a passband gain of up.
+    """
+    length = up * taps_per_phase
+    # Cutoff in cycles per sample at the upsampled rate, a little below
+    # the lower of the two Nyquist frequencies
+    cutoff = 0.5 / max(up, down) * 0.94
+    n = np.arange(length) - (length - 1) / 2
+    taps = 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(length, beta)
+    taps *= up / taps.sum()
+    # Row p holds taps p, p + up, p + 2 * up, ...
+    return taps.reshape(taps_per_phase, up).T.astype(np.float32).copy()
+
+
+class PolyphaseResampler:
+    """Streaming mono resampler; output is continuous across chunks"""
+
+    def __init__(self, from_rate: int, to_rate: int, taps_per_phase: int = 24):
+        divisor = math.gcd(from_rate, to_rate)
+        self.up = to_rate // divisor
+        self.down = from_rate // divisor
+        self.filters = design_lowpass(self.up, self.down, taps_per_phase)
+        self.taps = taps_per_phase
+        # Last taps - 1 input samples, needed by the next chunk's outputs
+        self._history = np.zeros(taps_per_phase - 1, dtype=np.float32)
+        # Upsampled position of the next output, relative to the next
+        # chunk's first input sample
+        self._position = 0
+        self._offsets = np.arange(taps_per_phase)
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        count = len(samples)
+        end = count * self.up
+        if end <= self._position:
+            outputs = 0
+        else:
+            outputs = -(-(end - self._position) // self.down)
+        x = np.concatenate((self._history, samples))
+        positions = self._position + self.down * np.arange(outputs)
+        phases = positions % self.up
+        # Index of each output's newest input sample within x
+        newest = positions // self.up + (self.taps - 1)
+        window = x[newest[:, None] - self._offsets[None, :]]
+        out = np.einsum("ij,ij->i", self.filters[phases], window)
+        self._position += outputs * self.down - end
+        self._history = x[len(x) - (self.taps - 1):]
+        return out
+
+
+class AudioConverter:
+    """Converts a stream of PCM chunks from one AudioFormat to another"""
+
+    def __init__(self, source: AudioFormat, target: AudioFormat):
+        self.source = source
+        self.target = target
+        self.identity = source == target
+        self.resampler = (
+            PolyphaseResampler(source.sample_rate, target.sample_rate)
+            if source.sample_rate != target.sample_rate else None
+        )
+
+    def convert(self, chunk) -> bytes:
+        """Convert a chunk of whole sample frames"""
+        if len(chunk) % self.source.frame_size:
+            raise ValueError(
+                f"Audio chunks must be whole {self.source} sample frames"
+            )
+        if self.identity:
+            return chunk
+        samples = np.frombuffer(chunk, dtype=self.source.dtype)
+        if self.source.encoding == "s16":
+            samples = samples.astype(np.float32) / PCM16_SCALE
+        else:
+            samples = samples.astype(np.float32, copy=False)
+        if self.source.channels > 1:
+            samples = samples.reshape(-1, self.source.channels).mean(axis=1)
+        if self.resampler is not None:
+            samples = self.resampler.process(samples)
+        if self.target.channels > 1:
+            samples = np.repeat(samples, self.target.channels)
+        if self.target.encoding == "s16":
+            samples = np.clip(
+                np.rint(samples * PCM16_SCALE), -PCM16_SCALE, PCM16_SCALE - 1
+            )
+        return samples.astype(self.target.dtype).tobytes()
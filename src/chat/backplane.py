@@ -0,0 +1,202 @@
+"""
+Cross-process delivery of chat room broadcasts.
+
+Every uvicorn worker owns its own ConnectionManager. A backplane relays
+room broadcasts between workers so a message posted in one process reaches
+sockets held by another.
+"""
+import asyncio
+import logging
+import uuid
+from typing import Callable, Optional, Set
+
+from config import settings
+
+from .codec import JSON_CODEC, CodecError, OutboundFrame
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = "chat:room:"
+
+# deliver(room_id, frame, exclude_user)
+DeliverCallback = Callable[[int, OutboundFrame, Optional[int]], None]
+
+
+class LocalBackplane:
+    """Single-process backplane: broadcasts never leave this worker"""
+
+    def __init__(self):
+        self.deliver: Optional[DeliverCallback] = None
+
+    def bind(self, deliver: DeliverCallback):
+        self.deliver = deliver
+
+    def subscribe(self, room_id: int):
+        pass
+
+    def unsubscribe(self, room_id: int):
+        pass
+
+    def publish(
+        self, room_id: int, frame: OutboundFrame, exclude_user: int = None
+    ):
+        pass
+
+    async def close(self):
+        pass
+
+
+class RedisBackplane(LocalBackplane):
+    """
+    Redis pub/sub backplane.
+    Each process subscribes only to the rooms it has local sockets in and
+    ignores its own publications, which it has already fanned out locally.
+
+    A publication is a small JSON header line followed by the message's
+    JSON encoding, so receivers can forward it to JSON clients as-is.
+    """
+
+    def __init__(self, redis, node_id: str = None, poll_interval: float = 0.1):
+        super().__init__()
+        self.redis = redis
+        self.node_id = node_id or uuid.uuid4().hex
+        self.poll_interval = poll_interval
+        self.rooms: Set[int] = set()
+        self._changed: Optional[asyncio.Event] = None
+        self._outbox: Optional[asyncio.Queue] = None
+        self._listener: Optional[asyncio.Task] = None
+        self._publisher: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _channel(room_id: int) -> str:
+        return f"{CHANNEL_PREFIX}{room_id}"
+
+    def _ensure_started(self):
+        if self._listener is None:
+            self._changed = asyncio.Event()
+            self._outbox = asyncio.Queue()
+            self._listener = asyncio.create_task(self._listen())
+            self._publisher = asyncio.create_task(self._publish_loop())
+
+    def subscribe(self, room_id: int):
+        self._ensure_started()
+        self.rooms.add(room_id)
+        self._changed.set()
+
+    def unsubscribe(self, room_id: int):
+        self.rooms.discard(room_id)
+        if self._changed is not None:
+            self._changed.set()
+
+    def publish(
+        self, room_id: int, frame: OutboundFrame, exclude_user: int = None
+    ):
+        """Queue a broadcast for other workers without waiting on Redis"""
+        self._ensure_started()
+        header = JSON_CODEC.encode({
+            "origin": self.node_id,
+            "exclude_user": exclude_user,
+            "type": frame.type
+        })
+        payload = f"{header}\n{frame.encode(JSON_CODEC)}"
+        self._outbox.put_nowait((self._channel(room_id), payload))
+
+    async def _publish_loop(self):
+        stopping = False
+        while not stopping:
+            batch = [await self._outbox.get()]
+            while not self._outbox.empty():
+                batch.append(self._outbox.get_nowait())
+            if None in batch:
+                # close() was called; publish what was queued before it
+                stopping = True
+                batch = [item for item in batch if item is not None]
+            try:
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    for channel, payload in batch:
+                        pipe.publish(channel, payload)
+                    await pipe.execute()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(
+                    f"Error publishing {len(batch)} chat broadcasts: {e}"
+                )
+
+    async def _listen(self):
+        while True:
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            subscribed: Set[int] = set()
+            # A fresh connection starts with no subscriptions
+            self._changed.set()
+            try:
+                while True:
+                    # Diff the rooms only when they changed, not per message
+                    if self._changed.is_set():
+                        self._changed.clear()
+                        wanted = set(self.rooms)
+                        added = wanted - subscribed
+                        removed = subscribed - wanted
+                        if added:
+                            await pubsub.subscribe(
+                                *(self._channel(room_id) for room_id in added)
+                            )
+                        if removed:
+                            await pubsub.unsubscribe(
+                                *(self._channel(room_id) for room_id in removed)
+                            )
+                        subscribed = wanted
+                    if not subscribed:
+                        await self._changed.wait()
+                        continue
+                    message = await pubsub.get_message(
+                        ignore_subscribe_messages=True,
+                        timeout=self.poll_interval
+                    )
+                    if message is not None:
+                        self._dispatch(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Chat backplane listener error: {e}")
+                await asyncio.sleep(1)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+
+    def _dispatch(self, message: dict):
+        try:
+            room_id = int(message["channel"][len(CHANNEL_PREFIX):])
+            header, body = message["data"].split("\n", 1)
+            envelope = JSON_CODEC.decode(header)
+        except (CodecError, ValueError, TypeError, KeyError):
+            logger.error(f"Malformed chat backplane message: {message}")
+            return
+        if envelope.get("origin") == self.node_id or self.deliver is None:
+            return
+        frame = OutboundFrame.from_encoded(JSON_CODEC, body, envelope["type"])
+        self.deliver(room_id, frame, envelope.get("exclude_user"))
+
+    async def close(self):
+        if self._listener is None:
+            return
+        self._listener.cancel()
+        # Let queued publications go out before stopping the publisher
+        self._outbox.put_nowait(None)
+        await asyncio.gather(
+            self._listener, self._publisher, return_exceptions=True
+        )
+        self._listener = None
+        self._publisher = None
+
+
+def create_backplane(kind: str = settings.chat_backplane) -> LocalBackplane:
+    """Build the backplane selected by the chat_backplane setting"""
+    if kind == "redis":
+        from redis_client import async_redis_client
+        return RedisBackplane(async_redis_client)
+    if kind == "local":
+        return LocalBackplane()
+    raise ValueError(f"Unknown chat backplane: {kind}")
@@ -0,0 +1,138 @@
+"""
+Wire codecs for chat WebSocket frames.
+
+Clients pick a codec through the Sec-WebSocket-Protocol header:
+- "chat.msgpack": binary MessagePack frames
+- "chat.json" or no subprotocol: JSON text frames (legacy clients)
+
+Outbound messages are wrapped in an OutboundFrame so each payload is
+encoded at most once per codec, however many sockets it is sent to.
+"""
+import json
+from typing import Dict, List, Optional, Union
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - stdlib fallback
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - MessagePack is optional
+    msgpack = None
+
+
+class CodecError(ValueError):
+    """Raised when an inbound frame cannot be decoded."""
+    pass
+
+
+class JsonCodec:
+    name = "json"
+    subprotocol = "chat.json"
+    binary = False
+
+    def encode(self, message: dict) -> str:
+        if orjson is not None:
+            return orjson.dumps(message).decode("utf-8")
+        return json.dumps(message, separators=(",", ":"))
+
+    def decode(self, data: Union[str, bytes]) -> dict:
+        try:
+            if orjson is not None:
+                message = orjson.loads(data)
+            else:
+                message = json.loads(data)
+        except ValueError as e:
+            raise CodecError(str(e))
+        if not isinstance(message, dict):
+            raise CodecError("Frame must be an object")
+        return message
+
+
+class MsgpackCodec:
+    name = "msgpack"
+    subprotocol = "chat.msgpack"
+    binary = True
+
+    def encode(self, message: dict) -> bytes:
+        return msgpack.packb(message, use_bin_type=True)
+
+    def decode(self, data: Union[str, bytes]) -> dict:
+        if isinstance(data, str):
+            raise CodecError("Expected a binary frame")
+        try:
+            message = msgpack.unpackb(data, raw=False)
+        except Exception as e:
+            raise CodecError(str(e))
+        if not isinstance(message, dict):
+            raise CodecError("Frame must be a map")
+        return message
+
+
+JSON_CODEC = JsonCodec()
+MSGPACK_CODEC = MsgpackCodec() if msgpack is not None else None
+
+# Server preference order for subprotocol negotiation
+_CODECS = [codec for codec in (MSGPACK_CODEC, JSON_CODEC) if codec is not None]
+
+
+def negotiate_codec(offered: List[str]):
+    """
+    Pick a codec from the client's offered subprotocols.
+    Returns (codec, subprotocol to echo back or None).
+    """
+    for codec in _CODECS:
+        if codec.subprotocol in offered:
+            return codec, codec.subprotocol
+    return JSON_CODEC, None
+
+
+class OutboundFrame:
+    """A message shared by every recipient, encoded once per codec"""
+
+    __slots__ = ("type", "_message", "_encoded", "_sizes")
+
+    def __init__(self, message: Optional[dict] = None, type: str = None):
+        self._message = message
+        self.type = type if type is not None else message.get("type")
+        self._encoded: Dict[str, Union[str, bytes]] = {}
+        self._sizes: Dict[str, int] = {}
+
+    @classmethod
+    def from_encoded(cls, codec, payload: Union[str, bytes], type: str):
+        """Wrap a payload that was already encoded, e.g. by another worker"""
+        frame = cls(type=type)
+        frame._encoded[codec.name] = payload
+        return frame
+
+    @classmethod
+    def batch(cls, room_id: int, frames: List["OutboundFrame"]):
+        """Combine frames into one "batch" frame, splicing their JSON"""
+        events = ",".join(frame.encode(JSON_CODEC) for frame in frames)
+        payload = f'{{"type":"batch","room_id":{room_id},"events":[{events}]}}'
+        return cls.from_encoded(JSON_CODEC, payload, "batch")
+
+    @property
+    def message(self) -> dict:
+        if self._message is None:
+            name, payload = next(iter(self._encoded.items()))
+            codec = JSON_CODEC if name == JSON_CODEC.name else MSGPACK_CODEC
+            self._message = codec.decode(payload)
+        return self._message
+
+    def encode(self, codec) -> Union[str, bytes]:
+        payload = self._encoded.get(codec.name)
+        if payload is None:
+            payload = self._encoded[codec.name] = codec.encode(self.message)
+        return payload
+
+    def size(self, codec) -> int:
+        """Size of the encoded payload in bytes, as it goes on the wire"""
+        size = self._sizes.get(codec.name)
+        if size is None:
+            payload = self.encode(codec)
+            if isinstance(payload, str):
+                payload = payload.encode("utf-8")
+            size = self._sizes[codec.name] = len(payload)
+        return size
@@ -0,0 +1,167 @@
+import base64
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import Float, exists, func, literal, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from chat.partitions import hot_cutoff
+from chat.schema import SEARCH_CONFIG, Message
+
+HEADLINE_OPTIONS = "MaxFragments=2, MaxWords=20, MinWords=5"
+
+
+class MessageCRUD:
+    @staticmethod
+    async def get_message_page(
+        db: AsyncSession,
+        room_id: int,
+        before: Optional[int] = None,
+        after: Optional[int] = None,
+        limit: int = 50,
+        include_older: bool = False
+    ) -> Tuple[List[Message], bool, bool]:
+        """
+        Get one page of a room's history in chronological order.
+        Keyset-paginated on (created_at, id) relative to the message ids
+        given as before/after; the latest page when neither is set.
+        Unless include_older is set, only the hot monthly partitions are
+        read.
+        Returns the messages, whether more exist in that direction and
+        whether older messages exist beyond the hot window.
+        """
+        if before is not None and after is not None:
+            raise HTTPException(
+                status_code=400,
+                detail="Use either 'before' or 'after', not both"
+            )
+        stmt = select(Message).where(Message.room_id == room_id)
+        cutoff = None
+        if not include_older:
+            # Lets Postgres prune the cold partitions
+            cutoff = hot_cutoff()
+            stmt = stmt.where(Message.created_at >= cutoff)
+        key = tuple_(Message.created_at, Message.id)
+        cursor_id = before if before is not None else after
+        if cursor_id is not None:
+            cursor_stmt = select(Message.created_at).where(
+                Message.id == cursor_id,
+                Message.room_id == room_id
+            )
+            if cutoff is not None:
+                cursor_stmt = cursor_stmt.where(Message.created_at >= cutoff)
+            cursor_result = await db.execute(cursor_stmt)
+            cursor_created_at = cursor_result.scalar_one_or_none()
+            if cursor_created_at is None:
+                raise HTTPException(
+                    status_code=404, detail="Cursor message not found"
+                )
+            cursor = tuple_(cursor_created_at, cursor_id)
+            if after is not None:
+                stmt = stmt.where(key > cursor)
+            else:
+                stmt = stmt.where(key < cursor)
+
+        if after is not None:
+            stmt = stmt.order_by(Message.created_at.asc(), Message.id.asc())
+        else:
+            stmt = stmt.order_by(Message.created_at.desc(), Message.id.desc())
+        # Fetch one extra row to learn whether another page exists
+        result = await db.execute(stmt.limit(limit + 1))
+        messages = list(result.scalars().all())
+        has_more = len(messages) > limit
+        messages = messages[:limit]
+        has_older = False
+        if cutoff is not None and after is None and not has_more:
+            # Reached the end of the hot window going back in time
+            has_older = bool(await db.scalar(select(exists().where(
+                Message.room_id == room_id,
+                Message.created_at < cutoff
+            ))))
+        if after is None:
+            messages.reverse()
+        return messages, has_more, has_older
+
+    @staticmethod
+    def encode_search_cursor(rank: float, message_id: int) -> str:
+        raw = f"{rank!r}:{message_id}".encode()
+        return base64.urlsafe_b64encode(raw).decode()
+
+    @staticmethod
+    def decode_search_cursor(cursor: str) -> Tuple[float, int]:
+        try:
+            rank, message_id = base64.urlsafe_b64decode(
+                cursor.encode()
+            ).decode().split(":")
+            return float(rank), int(message_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    @staticmethod
+    async def search_messages(
+        db: AsyncSession,
+        room_ids: Iterable[int],
+        query: str,
+        limit: int = 20,
+        cursor: Optional[str] = None,
+        candidate_limit: int = 10000
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """
+        Full-text search over the messages of the given rooms.
+        Only the newest candidate_limit matches are ranked, which bounds
+        the cost of common terms on large tables. Results are ordered by
+        (rank, id) descending and keyset-paginated on that pair.
+        Returns the hits and the cursor of the next page, if any.
+        """
+        room_ids = list(room_ids)
+        if not room_ids:
+            return [], None
+        tsquery = func.websearch_to_tsquery(SEARCH_CONFIG, query)
+        # GIN index for the match, newest first by primary key
+        candidates = (
+            select(
+                Message.id,
+                Message.room_id,
+                Message.user_id,
+                Message.content,
+                Message.message_type,
+                Message.created_at,
+                func.ts_rank_cd(Message.search_vector, tsquery).label("rank")
+            )
+            .where(
+                Message.search_vector.op("@@")(tsquery),
+                Message.room_id.in_(room_ids)
+            )
+            .order_by(Message.id.desc())
+            .limit(candidate_limit)
+            .cte("candidates")
+        )
+        page = select(candidates)
+        if cursor is not None:
+            cursor_rank, cursor_id = MessageCRUD.decode_search_cursor(cursor)
+            page = page.where(
+                tuple_(candidates.c.rank, candidates.c.id) <
+                tuple_(literal(cursor_rank, Float), cursor_id)
+            )
+        page = (
+            page.order_by(candidates.c.rank.desc(), candidates.c.id.desc())
+            .limit(limit + 1)
+            .subquery("page")
+        )
+        # Headlines are expensive, so only build them for the page itself
+        stmt = select(
+            page,
+            func.ts_headline(
+                SEARCH_CONFIG, page.c.content, tsquery, HEADLINE_OPTIONS
+            ).label("headline")
+        ).order_by(page.c.rank.desc(), page.c.id.desc())
+        result = await db.execute(stmt)
+        hits = [dict(row) for row in result.mappings().all()]
+        next_cursor = None
+        if len(hits) > limit:
+            hits = hits[:limit]
+            last = hits[-1]
+            next_cursor = MessageCRUD.encode_search_cursor(
+                last["rank"], last["id"]
+            )
+        return hits, next_cursor
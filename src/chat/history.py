@@ -0,0 +1,133 @@
+"""
+Recent-message ring buffers used to resume chat sockets after a reconnect.
+
+Each worker keeps the last N message frames of the rooms it has sockets
+in. The worker that originates a message also mirrors it to a capped
+Redis list so any worker can replay it, even one that just subscribed.
+"""
+import asyncio
+import logging
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from config import settings
+
+from .codec import JSON_CODEC, CodecError, OutboundFrame
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "chat:recent:"
+
+
+class RecentMessages:
+    def __init__(
+        self,
+        size: int = settings.chat_recent_messages,
+        redis=None,
+        ttl: int = settings.chat_recent_messages_ttl
+    ):
+        self.size = size
+        self.redis = redis
+        self.ttl = ttl
+        # room_id -> (message_id, frame), oldest first
+        self._rooms: Dict[int, Deque[Tuple[int, OutboundFrame]]] = {}
+        self._outbox: List[Tuple[int, str]] = []
+        self._mirror_task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _key(room_id: int) -> str:
+        return f"{KEY_PREFIX}{room_id}"
+
+    def record(self, room_id: int, frame: OutboundFrame):
+        """Remember a message frame delivered to this worker's sockets"""
+        message_id = frame.message.get("message_id")
+        if message_id is None:
+            return
+        room = self._rooms.get(room_id)
+        if room is None:
+            room = self._rooms[room_id] = deque(maxlen=self.size)
+        room.append((message_id, frame))
+
+    def forget(self, room_id: int):
+        # Once a room has no local sockets this worker stops receiving its
+        # messages, so the buffer would silently develop gaps
+        self._rooms.pop(room_id, None)
+
+    def mirror(self, room_id: int, frame: OutboundFrame):
+        """Append a locally originated message to the room's Redis list"""
+        if self.redis is None:
+            return
+        self._outbox.append((room_id, frame.encode(JSON_CODEC)))
+        if self._mirror_task is None:
+            self._mirror_task = asyncio.create_task(self._flush_mirror())
+
+    async def _flush_mirror(self):
+        try:
+            while self._outbox:
+                batch, self._outbox = self._outbox, []
+                try:
+                    async with self.redis.pipeline(transaction=False) as pipe:
+                        for room_id, payload in batch:
+                            pipe.rpush(self._key(room_id), payload)
+                        for room_id in {room_id for room_id, _ in batch}:
+                            pipe.ltrim(self._key(room_id), -self.size, -1)
+                            pipe.expire(self._key(room_id), self.ttl)
+                        await pipe.execute()
+                except Exception as e:
+                    logger.error(
+                        f"Error mirroring {len(batch)} recent messages: {e}"
+                    )
+        finally:
+            self._mirror_task = None
+
+    def missed_since(
+        self, room_id: int, last_message_id: int
+    ) -> Optional[List[OutboundFrame]]:
+        """
+        Frames after last_message_id from the local buffer.
+        Returns None when the buffer cannot tell what was missed.
+        """
+        room = self._rooms.get(room_id)
+        if not room:
+            return None
+        for index, (message_id, _) in enumerate(room):
+            if message_id == last_message_id:
+                return [frame for _, frame in list(room)[index + 1:]]
+        return None
+
+    async def fetch_missed(
+        self, room_id: int, last_message_id: int
+    ) -> Optional[List[OutboundFrame]]:
+        """Same as missed_since, but read from the Redis mirror"""
+        if self.redis is None:
+            return None
+        try:
+            payloads = await self.redis.lrange(self._key(room_id), 0, -1)
+        except Exception as e:
+            logger.error(f"Error reading recent messages of room {room_id}: {e}")
+            return None
+        frames = []
+        found = False
+        for payload in payloads:
+            frame = OutboundFrame.from_encoded(JSON_CODEC, payload, "message")
+            try:
+                message_id = frame.message.get("message_id")
+            except CodecError:
+                continue
+            if found:
+                frames.append(frame)
+            elif message_id == last_message_id:
+                found = True
+        return frames if found else None
+
+    async def close(self):
+        if self._mirror_task is not None:
+            await asyncio.gather(self._mirror_task, return_exceptions=True)
+
+
+def create_recent_messages() -> RecentMessages:
+    """Build the ring buffers, mirrored to Redis when enabled"""
+    if settings.chat_recent_messages_mirror:
+        from redis_client import async_redis_client
+        return RecentMessages(redis=async_redis_client)
+    return RecentMessages()
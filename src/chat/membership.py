@@ -0,0 +1,179 @@
+"""
+Cache of which rooms each user participates in.
+
+Lookups hit an in-process map first, then a Redis set shared by all
+workers, and only then chat_participants. A cached set can only be stale
+by missing a room the user joined through another worker, so a negative
+answer is always re-checked against the database.
+"""
+import logging
+import time
+from typing import Dict, FrozenSet, Optional, Tuple
+
+from redis.exceptions import WatchError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from redis_client import async_redis_client
+
+from .schema import ChatParticipant
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "chat:memberships:"
+# Bumped on every change of a user's memberships
+GENERATION_KEY_PREFIX = "chat:memberships_gen:"
+# Room ids start at 1; keeps the Redis set non-empty for users in no rooms
+_EMPTY_MARKER = "0"
+
+
+class MembershipCache:
+    def __init__(
+        self,
+        ttl: int = settings.chat_membership_ttl,
+        max_users: int = settings.chat_membership_max_users,
+        redis=None
+    ):
+        self.ttl = ttl
+        self.max_users = max_users
+        self.redis = redis
+        # user_id -> (expires_at, room ids)
+        self._entries: Dict[int, Tuple[float, FrozenSet[int]]] = {}
+
+    @staticmethod
+    def _key(user_id: int) -> str:
+        return f"{KEY_PREFIX}{user_id}"
+
+    @staticmethod
+    def _generation_key(user_id: int) -> str:
+        return f"{GENERATION_KEY_PREFIX}{user_id}"
+
+    async def get_rooms(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        refresh: bool = False,
+        shared: bool = False
+    ) -> FrozenSet[int]:
+        """
+        Get the ids of the rooms a user participates in.
+        shared skips this worker's copy and reads through to Redis, which
+        every join invalidates. Listings use it: unlike is_member, they
+        cannot re-check a room that is missing.
+        """
+        rooms = None
+        if not refresh:
+            entry = self._entries.get(user_id)
+            if not shared and entry is not None and entry[0] > time.monotonic():
+                return entry[1]
+            rooms = await self._load_redis(user_id)
+        if rooms is None:
+            # Read before the database, so a join committed while we load
+            # makes the store below a no-op
+            generation = await self._generation(user_id)
+            rooms = await self._load_db(db, user_id)
+            await self._store_redis(user_id, rooms, generation)
+        self._remember(user_id, rooms)
+        return rooms
+
+    async def is_member(
+        self, db: AsyncSession, user_id: int, room_id: int
+    ) -> bool:
+        if room_id in await self.get_rooms(db, user_id):
+            return True
+        # The user may have joined through another worker since we cached
+        return room_id in await self.get_rooms(db, user_id, refresh=True)
+
+    async def add(self, user_id: int, room_id: int):
+        """Record a join or room creation"""
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            self._entries[user_id] = (entry[0], entry[1] | {room_id})
+        await self.invalidate_shared(user_id)
+
+    async def invalidate(self, user_id: int):
+        self._entries.pop(user_id, None)
+        await self.invalidate_shared(user_id)
+
+    async def invalidate_shared(self, user_id: int):
+        """
+        Drop the shared set and bump the user's generation. A reader that
+        loaded the database before the change sees a different generation
+        and does not write its stale set back.
+        """
+        if self.redis is None:
+            return
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.incr(self._generation_key(user_id))
+                pipe.expire(self._generation_key(user_id), self.ttl)
+                pipe.delete(self._key(user_id))
+                await pipe.execute()
+        except Exception as e:
+            logger.error(f"Error invalidating memberships of {user_id}: {e}")
+
+    def _remember(self, user_id: int, rooms: FrozenSet[int]):
+        self._entries.pop(user_id, None)
+        if len(self._entries) >= self.max_users:
+            # Dicts keep insertion order, so this evicts the oldest entry
+            del self._entries[next(iter(self._entries))]
+        self._entries[user_id] = (time.monotonic() + self.ttl, rooms)
+
+    async def _load_db(self, db: AsyncSession, user_id: int) -> FrozenSet[int]:
+        result = await db.execute(
+            select(ChatParticipant.room_id).where(
+                ChatParticipant.user_id == user_id
+            )
+        )
+        return frozenset(result.scalars().all())
+
+    async def _load_redis(self, user_id: int) -> Optional[FrozenSet[int]]:
+        if self.redis is None:
+            return None
+        try:
+            members = await self.redis.smembers(self._key(user_id))
+        except Exception as e:
+            logger.error(f"Error reading memberships of {user_id}: {e}")
+            return None
+        if not members:
+            return None
+        return frozenset(
+            int(member) for member in members if member != _EMPTY_MARKER
+        )
+
+    async def _generation(self, user_id: int) -> Optional[str]:
+        if self.redis is None:
+            return None
+        try:
+            return await self.redis.get(self._generation_key(user_id))
+        except Exception as e:
+            logger.error(f"Error reading membership generation of {user_id}: {e}")
+            return None
+
+    async def _store_redis(
+        self, user_id: int, rooms: FrozenSet[int], generation: Optional[str]
+    ):
+        """Cache rooms unless the user's memberships changed since generation"""
+        if self.redis is None:
+            return
+        generation_key = self._generation_key(user_id)
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                await pipe.watch(generation_key)
+                if await pipe.get(generation_key) != generation:
+                    return
+                pipe.multi()
+                pipe.delete(self._key(user_id))
+                pipe.sadd(self._key(user_id), _EMPTY_MARKER, *rooms)
+                pipe.expire(self._key(user_id), self.ttl)
+                await pipe.execute()
+        except WatchError:
+            # Invalidated while we were writing; the next miss reloads
+            pass
+        except Exception as e:
+            logger.error(f"Error caching memberships of {user_id}: {e}")
+
+
+# Global membership cache instance
+membership_cache = MembershipCache(redis=async_redis_client)
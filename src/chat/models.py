@@ -1,7 +1,26 @@
 from datetime import datetime
 from typing import List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, field_validator
+
+from config import settings
+
+# Length of messages.message_type
+MESSAGE_TYPE_MAX_LENGTH = 20
+
+
+def check_message_content(content: str) -> str:
+    """Reject content that Postgres or the search index cannot store"""
+    if not content:
+        raise ValueError("Message content must not be empty")
+    if len(content) > settings.chat_message_max_length:
+        raise ValueError(
+            "Message content must be at most "
+            f"{settings.chat_message_max_length} characters"
+        )
+    if "\x00" in content:
+        raise ValueError("Message content must not contain NUL characters")
+    return content
 
 
 class ChatRoomBase(BaseModel):
@@ -20,8 +39,18 @@ class ChatRoomUpdate(BaseModel):
     is_public: Optional[bool] = None
 
 
+class ChatRoomBatching(BaseModel):
+    # None turns batching off
+    window_ms: Optional[int] = None
+
+
 class ChatRoom(ChatRoomBase):
     id: int
+    batch_window_ms: Optional[int] = None
+    member_count: int = 0
+    last_message_id: Optional[int] = None
+    last_message_preview: Optional[str] = None
+    last_message_at: Optional[datetime] = None
     created_at: datetime
     updated_at: Optional[datetime] = None
 
@@ -36,12 +65,21 @@ class MessageBase(BaseModel):
 
 class MessageCreate(MessageBase):
     room_id: int
+    message_type: str = Field(
+        "text", min_length=1, max_length=MESSAGE_TYPE_MAX_LENGTH
+    )
+
+    @field_validator("content")
+    @classmethod
+    def validate_content(cls, content: str) -> str:
+        return check_message_content(content)
 
 
 class Message(MessageBase):
     id: int
     room_id: int
     user_id: int
+    seq: Optional[int] = None
     created_at: datetime
 
     class Config:
@@ -61,11 +99,23 @@ class ChatParticipantCreate(ChatParticipantBase):
 class ChatParticipant(ChatParticipantBase):
     id: int
     joined_at: datetime
+    last_read_message_id: Optional[int] = None
 
     class Config:
         from_attributes = True
 
 
+class ChatRoomSummary(ChatRoom):
+    # Only set for rooms the user participates in
+    unread_count: Optional[int] = None
+    last_read_message_id: Optional[int] = None
+
+
+class ChatRoomPage(BaseModel):
+    rooms: List[ChatRoomSummary] = []
+    has_more: bool = False
+
+
 class WebSocketMessage(BaseModel):
     type: str
     content: Optional[str] = None
@@ -75,6 +125,27 @@ class WebSocketMessage(BaseModel):
     timestamp: Optional[datetime] = None
 
 
+class MessagePage(BaseModel):
+    messages: List[Message] = []
+    has_more: bool = False
+    # Older messages exist beyond the hot window; ask with include_older
+    has_older: bool = False
+
+
+class MessageSearchHit(Message):
+    rank: float
+    # Matching fragments with the terms wrapped in <b></b>
+    headline: str
+
+
+class MessageSearchPage(BaseModel):
+    results: List[MessageSearchHit] = []
+    # Pass back as ?cursor= for the next page; None on the last page
+    next_cursor: Optional[str] = None
+
+
 class RoomWithMessages(ChatRoom):
+    # Only the most recent page; older history via GET .../messages
     messages: List[Message] = []
+    has_more_messages: bool = False
     participants: List[ChatParticipant] = []
@@ -0,0 +1,165 @@
+"""
+Monthly range partitions of the messages table.
+
+messages is partitioned on created_at into messages_pYYYYMM tables, plus
+messages_default for rows outside every range. Maintenance runs in Celery:
+it creates partitions ahead of time, detaches months older than the
+retention window, exports them as gzipped CSV and drops them.
+"""
+import gzip
+import logging
+import os
+import re
+from datetime import date, datetime, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = "messages"
+PARTITION_PATTERN = re.compile(r"^messages_p(\d{4})(\d{2})$")
+
+
+def month_start(day: date, offset: int = 0) -> date:
+    """First day of the month offset months away from day's month"""
+    month_index = day.year * 12 + day.month - 1 + offset
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARENT_TABLE}_p{month.year:04d}{month.month:02d}"
+
+
+def partition_month(name: str) -> Optional[date]:
+    match = PARTITION_PATTERN.match(name)
+    if match is None:
+        return None
+    return date(int(match.group(1)), int(match.group(2)), 1)
+
+
+def hot_cutoff(
+    months: int = settings.chat_history_hot_months,
+    now: Optional[datetime] = None
+) -> datetime:
+    """Start of the oldest month history reads cover by default"""
+    today = (now or datetime.now(timezone.utc)).date()
+    start = month_start(today, -(months - 1))
+    return datetime(start.year, start.month, 1, tzinfo=timezone.utc)
+
+
+def create_partition(connection, month: date) -> bool:
+    """Create the partition for month; returns False if it existed"""
+    name = partition_name(month)
+    exists = connection.execute(
+        text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name}
+    ).scalar()
+    if exists:
+        return False
+    connection.execute(text(
+        f"CREATE TABLE {name} PARTITION OF {PARENT_TABLE} "
+        f"FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') "
+        f"TO ('{month_start(month, 1).isoformat()} 00:00:00+00')"
+    ))
+    logger.info(f"Created message partition {name}")
+    return True
+
+
+def ensure_partitions(
+    connection,
+    months_ahead: int = settings.chat_partition_months_ahead,
+    today: Optional[date] = None
+) -> List[str]:
+    """Make sure this month and the next months_ahead have partitions"""
+    today = today or datetime.now(timezone.utc).date()
+    created = []
+    for offset in range(months_ahead + 1):
+        month = month_start(today, offset)
+        if create_partition(connection, month):
+            created.append(partition_name(month))
+    return created
+
+
+def list_partitions(connection) -> Dict[str, bool]:
+    """Monthly partition tables by name -> whether still attached"""
+    rows = connection.execute(text(
+        """
+        SELECT c.relname, i.inhparent IS NOT NULL AS attached
+        FROM pg_class c
+        LEFT JOIN pg_inherits i
+          ON i.inhrelid = c.oid
+         AND i.inhparent = CAST(:parent AS regclass)
+        WHERE c.relkind = 'r' AND c.relname LIKE :pattern
+        """
+    ), {"parent": PARENT_TABLE, "pattern": f"{PARENT_TABLE}\\_p%"})
+    return {
+        name: attached for name, attached in rows
+        if partition_month(name) is not None
+    }
+
+
+def export_partition(connection, name: str, directory: str) -> Dict:
+    """
+    Write a partition to <directory>/<name>.csv.gz and return its row count.
+    The file is written under a temporary name and renamed when complete.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{name}.csv.gz")
+    partial_path = f"{path}.partial"
+    # COPY needs the DBAPI (psycopg2) cursor
+    raw = connection.connection.dbapi_connection
+    with open(partial_path, "wb") as output:
+        with gzip.GzipFile(fileobj=output, mode="wb") as archive:
+            with raw.cursor() as cursor:
+                cursor.copy_expert(
+                    f"COPY (SELECT id, room_id, user_id, seq, content, "
+                    f"message_type, created_at FROM {name} ORDER BY id) "
+                    f"TO STDOUT WITH (FORMAT csv, HEADER)",
+                    archive
+                )
+        # Closing the GzipFile writes the gzip trailer; sync after it so
+        # the renamed file is never a truncated archive
+        output.flush()
+        os.fsync(output.fileno())
+    os.replace(partial_path, path)
+    rows = connection.execute(text(f"SELECT count(*) FROM {name}")).scalar()
+    return {"path": path, "rows": rows}
+
+
+def archive_partitions(
+    engine,
+    archive_after_months: int = settings.chat_archive_after_months,
+    directory: str = settings.chat_archive_dir,
+    today: Optional[date] = None
+) -> List[Dict]:
+    """
+    Detach, export and drop every monthly partition older than
+    archive_after_months. Partitions left detached by an interrupted run
+    are picked up again.
+    """
+    today = today or datetime.now(timezone.utc).date()
+    cutoff = month_start(today, -archive_after_months)
+    archived = []
+    with engine.connect() as connection:
+        partitions = list_partitions(connection)
+    for name, attached in sorted(partitions.items()):
+        if partition_month(name) >= cutoff:
+            continue
+        # One transaction per step, so a failed export keeps the table
+        if attached:
+            with engine.begin() as connection:
+                connection.execute(text(
+                    f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"
+                ))
+            logger.info(f"Detached message partition {name}")
+        with engine.begin() as connection:
+            result = export_partition(connection, name, directory)
+            connection.execute(text(f"DROP TABLE {name}"))
+        logger.info(
+            f"Archived {result['rows']} messages from {name} to "
+            f"{result['path']}"
+        )
+        archived.append({"partition": name, **result})
+    return archived
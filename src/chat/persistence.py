@@ -0,0 +1,267 @@
+"""
+Write-behind persistence for chat messages.
+
+Messages get their id and timestamp up front, are broadcast immediately
+and are written to the messages table later in multi-row INSERT batches.
+"""
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime, timezone
+from typing import Deque, Dict, List, Optional
+
+from sqlalchemy import (DateTime, Integer, String, column, insert, text,
+                        tuple_, update, values)
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+
+from config import settings
+from database import AsyncSessionLocal
+
+from .schema import PREVIEW_LENGTH, ChatRoom, Message
+
+logger = logging.getLogger(__name__)
+
+
+class WriterOverloadedError(Exception):
+    """Too many messages are waiting to be written"""
+
+
+def is_transient_error(error: DBAPIError) -> bool:
+    """
+    True for errors of the database or connection, which a retry may fix.
+    Anything else is a problem with the rows themselves.
+    """
+    return error.connection_invalidated or isinstance(
+        error, (OperationalError, InterfaceError)
+    )
+
+
+class MessageIdAllocator:
+    """Hands out message ids reserved in blocks from the messages sequence"""
+
+    def __init__(self, session_factory, block_size: int):
+        self.session_factory = session_factory
+        self.block_size = block_size
+        self._ids: Deque[int] = deque()
+        self._refill: Optional[asyncio.Task] = None
+
+    async def next_id(self) -> int:
+        while not self._ids:
+            await asyncio.shield(self._start_refill())
+        # Reserve the next block in the background before this one runs out
+        if len(self._ids) <= self.block_size // 4:
+            self._start_refill()
+        return self._ids.popleft()
+
+    def _start_refill(self) -> asyncio.Task:
+        if self._refill is None:
+            self._refill = asyncio.create_task(self._reserve())
+            # Background refills may fail with nobody awaiting them
+            self._refill.add_done_callback(
+                lambda task: task.cancelled() or task.exception()
+            )
+        return self._refill
+
+    async def _reserve(self):
+        try:
+            async with self.session_factory() as session:
+                result = await session.execute(
+                    text(
+                        "SELECT nextval(pg_get_serial_sequence('messages', 'id')) "
+                        "FROM generate_series(1, :count)"
+                    ),
+                    {"count": self.block_size}
+                )
+                self._ids.extend(row[0] for row in result)
+        finally:
+            self._refill = None
+
+
+class MessageWriter:
+    """Buffers message rows and flushes them by batch size or interval"""
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        batch_size: int = settings.chat_write_batch_size,
+        flush_interval: float = settings.chat_write_flush_interval_ms / 1000,
+        id_block_size: int = settings.chat_id_block_size,
+        max_buffer: int = settings.chat_write_max_buffer
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.max_buffer = max_buffer
+        self.flush_interval = flush_interval
+        self.ids = MessageIdAllocator(session_factory, id_block_size)
+        self._buffer: List[Dict] = []
+        self._lock = asyncio.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def create(
+        self,
+        room_id: int,
+        user_id: int,
+        content: str,
+        message_type: str = "text",
+        seq: Optional[int] = None
+    ) -> Dict:
+        """Assign an id and timestamp, queue the row and return it"""
+        self.ensure_capacity()
+        row = {
+            "id": await self.ids.next_id(),
+            "room_id": room_id,
+            "user_id": user_id,
+            "content": content,
+            "message_type": message_type,
+            "seq": seq,
+            "created_at": datetime.now(timezone.utc)
+        }
+        self.enqueue(row)
+        return row
+
+    def enqueue(self, row: Dict):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+        self._buffer.append(row)
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    def pending(self) -> int:
+        return len(self._buffer)
+
+    def ensure_capacity(self):
+        """Raise WriterOverloadedError while the buffer is full"""
+        if len(self._buffer) >= self.max_buffer:
+            raise WriterOverloadedError(
+                f"{len(self._buffer)} chat messages are waiting to be saved"
+            )
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(
+                    self._wakeup.wait(), timeout=self.flush_interval
+                )
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> bool:
+        """Write out everything buffered; returns False if rows remain"""
+        async with self._lock:
+            while self._buffer:
+                # Rows appended while a batch is in flight land after it
+                batch = self._buffer[:self.batch_size]
+                try:
+                    await self._insert(batch)
+                except Exception as e:
+                    logger.error(
+                        f"Error flushing {len(batch)} chat messages, "
+                        f"will retry: {e}"
+                    )
+                    return False
+                del self._buffer[:len(batch)]
+            return True
+
+    async def _insert(self, rows: List[Dict]):
+        async with self.session_factory() as session:
+            try:
+                await session.execute(insert(Message).values(rows))
+                await self._update_room_summaries(session, rows)
+                await session.commit()
+                return
+            except DBAPIError as e:
+                if is_transient_error(e):
+                    raise
+                await session.rollback()
+        # A bad row (unknown room or user, content Postgres rejects) must
+        # not block the rest; database outages still fail the whole batch
+        inserted = []
+        for row in rows:
+            async with self.session_factory() as session:
+                try:
+                    await session.execute(insert(Message).values(row))
+                    await session.commit()
+                    inserted.append(row)
+                except DBAPIError as e:
+                    if is_transient_error(e):
+                        raise
+                    logger.error(
+                        f"Dropping chat message {row['id']} "
+                        f"in room {row['room_id']}: {e}"
+                    )
+        if inserted:
+            async with self.session_factory() as session:
+                await self._update_room_summaries(session, inserted)
+                await session.commit()
+
+    @staticmethod
+    async def _update_room_summaries(session, rows: List[Dict]):
+        """Point each room's last-message summary at its newest row"""
+        latest: Dict[int, Dict] = {}
+        for row in rows:
+            current = latest.get(row["room_id"])
+            # Ids come from per-worker blocks, so they only order
+            # messages of the same worker; time decides, id breaks ties
+            if current is None or (
+                (current["created_at"], current["id"])
+                < (row["created_at"], row["id"])
+            ):
+                latest[row["room_id"]] = row
+        summaries = values(
+            column("room_id", Integer),
+            column("message_id", Integer),
+            column("preview", String),
+            column("created_at", DateTime(timezone=True)),
+            name="summaries"
+        ).data([
+            (
+                room_id,
+                row["id"],
+                row["content"][:PREVIEW_LENGTH],
+                row["created_at"]
+            )
+            for room_id, row in latest.items()
+        ])
+        await session.execute(
+            update(ChatRoom)
+            .where(
+                ChatRoom.id == summaries.c.room_id,
+                # Batches from several workers may land out of order
+                (ChatRoom.last_message_at.is_(None)) |
+                (
+                    tuple_(ChatRoom.last_message_at, ChatRoom.last_message_id)
+                    < tuple_(summaries.c.created_at, summaries.c.message_id)
+                )
+            )
+            .values(
+                last_message_id=summaries.c.message_id,
+                last_message_preview=summaries.c.preview,
+                last_message_at=summaries.c.created_at,
+                # A new message is not an edit of the room
+                updated_at=ChatRoom.updated_at
+            )
+        )
+
+    async def stop(self, attempts: int = 3):
+        """Stop the flusher and write out what is still buffered"""
+        if self._task is not None:
+            # Don't interrupt a batch that is already being written
+            async with self._lock:
+                self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for attempt in range(attempts):
+            if await self.flush():
+                return
+            await asyncio.sleep(0.5 * (attempt + 1))
+        logger.error(
+            f"Shutting down with {len(self._buffer)} unsaved chat messages"
+        )
+
+
+# Global write-behind buffer instance
+message_writer = MessageWriter()
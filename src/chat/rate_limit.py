@@ -0,0 +1,177 @@
+"""
+Rate limiting for inbound chat WebSocket frames.
+
+Every frame is charged against two token buckets kept in this worker: one
+for the connection and one shared by all of the user's connections. With
+a Redis client and a non-zero global limit, "message" frames are also
+counted in a per-user fixed window in Redis so the limit holds across
+workers. Clients that keep hitting the limit collect strikes and are
+disconnected once they have too many within the strike window.
+"""
+import logging
+import time
+from collections import deque
+from typing import Deque, Dict
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "chat:ratelimit:"
+GLOBAL_WINDOW = 60
+
+
+class TokenBucket:
+    """Refills at rate tokens per second, up to burst tokens"""
+
+    __slots__ = ("rate", "burst", "tokens", "updated_at")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(
+            self.burst, self.tokens + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+
+    def retry_after(self, cost: float = 1.0) -> float:
+        """Seconds until cost tokens are available, 0 if they are now"""
+        self._refill(time.monotonic())
+        if self.tokens >= cost:
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+    def consume(self, cost: float = 1.0):
+        self.tokens -= cost
+
+
+class ConnectionLimit:
+    """Rate limit state of one WebSocket connection"""
+
+    __slots__ = ("user_id", "bucket", "strikes")
+
+    def __init__(self, user_id: int, bucket: TokenBucket):
+        self.user_id = user_id
+        self.bucket = bucket
+        # Monotonic times of recently throttled frames
+        self.strikes: Deque[float] = deque()
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        connection_rate: float = settings.chat_rate_limit_connection_rate,
+        connection_burst: float = settings.chat_rate_limit_connection_burst,
+        user_rate: float = settings.chat_rate_limit_user_rate,
+        user_burst: float = settings.chat_rate_limit_user_burst,
+        max_strikes: int = settings.chat_rate_limit_max_strikes,
+        strike_window: float = settings.chat_rate_limit_strike_window,
+        global_limit: int = settings.chat_rate_limit_global_per_minute,
+        redis=None
+    ):
+        self.connection_rate = connection_rate
+        self.connection_burst = connection_burst
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.max_strikes = max_strikes
+        self.strike_window = strike_window
+        self.global_limit = global_limit
+        self.redis = redis
+        # user_id -> [shared bucket, number of open connections]
+        self._users: Dict[int, list] = {}
+        self.counters: Dict[str, int] = {
+            "throttled_frames": 0,
+            "global_throttled_frames": 0,
+            "disconnects": 0
+        }
+
+    def open(self, user_id: int) -> ConnectionLimit:
+        """Start tracking a new connection of user_id"""
+        entry = self._users.get(user_id)
+        if entry is None:
+            entry = self._users[user_id] = [
+                TokenBucket(self.user_rate, self.user_burst), 0
+            ]
+        entry[1] += 1
+        return ConnectionLimit(
+            user_id, TokenBucket(self.connection_rate, self.connection_burst)
+        )
+
+    def close(self, limit: ConnectionLimit):
+        entry = self._users.get(limit.user_id)
+        if entry is not None:
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del self._users[limit.user_id]
+
+    async def check(self, limit: ConnectionLimit, frame_type: str) -> float:
+        """
+        Charge one inbound frame.
+        Returns 0 if it may be processed, otherwise seconds to wait.
+        """
+        user_bucket = self._users[limit.user_id][0]
+        retry_after = max(
+            limit.bucket.retry_after(), user_bucket.retry_after()
+        )
+        if retry_after == 0 and frame_type == "message":
+            retry_after = await self._check_global(limit.user_id)
+        if retry_after > 0:
+            self.counters["throttled_frames"] += 1
+            self._strike(limit)
+            return retry_after
+        # Only frames that are let through use up tokens
+        limit.bucket.consume()
+        user_bucket.consume()
+        return 0.0
+
+    def should_disconnect(self, limit: ConnectionLimit) -> bool:
+        """True once a connection has too many strikes in the window"""
+        if len(limit.strikes) < self.max_strikes:
+            return False
+        self.counters["disconnects"] += 1
+        return True
+
+    def _strike(self, limit: ConnectionLimit):
+        now = time.monotonic()
+        limit.strikes.append(now)
+        while limit.strikes and limit.strikes[0] < now - self.strike_window:
+            limit.strikes.popleft()
+
+    async def _check_global(self, user_id: int) -> float:
+        if self.redis is None or self.global_limit <= 0:
+            return 0.0
+        now = time.time()
+        window = int(now // GLOBAL_WINDOW)
+        key = f"{KEY_PREFIX}{user_id}:{window}"
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.incr(key)
+                pipe.expire(key, GLOBAL_WINDOW * 2)
+                count, _ = await pipe.execute()
+        except Exception as e:
+            # Fail open; the local buckets still apply
+            logger.error(f"Error checking global rate limit of {user_id}: {e}")
+            return 0.0
+        if count <= self.global_limit:
+            return 0.0
+        self.counters["global_throttled_frames"] += 1
+        return (window + 1) * GLOBAL_WINDOW - now
+
+    def get_stats(self) -> Dict:
+        return {**self.counters, "tracked_users": len(self._users)}
+
+
+def create_rate_limiter() -> RateLimiter:
+    """Build the limiter, with Redis only when a global limit is set"""
+    if settings.chat_rate_limit_global_per_minute > 0:
+        from redis_client import async_redis_client
+        return RateLimiter(redis=async_redis_client)
+    return RateLimiter()
+
+
+# Global rate limiter instance
+rate_limiter = create_rate_limiter()
@@ -0,0 +1,220 @@
+"""
+Room message sequences and per-participant read markers.
+
+Every message gets a per-room sequence number from a Redis counter. A
+participant's read marker is the sequence of the last message they read,
+so an unread count is the room's sequence minus the marker, with no
+COUNT(*) over messages. Markers are buffered and written to
+chat_participants in batches.
+"""
+import asyncio
+import logging
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import BigInteger, Integer, column, func, select, update, values
+from sqlalchemy.exc import DBAPIError
+
+from config import settings
+from database import AsyncSessionLocal
+
+from .persistence import is_transient_error
+from .schema import ChatParticipant, Message
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "chat:room_seq:"
+
+
+class RoomSequences:
+    """Per-room message sequence counters kept in Redis"""
+
+    def __init__(self, redis, session_factory=AsyncSessionLocal):
+        self.redis = redis
+        self.session_factory = session_factory
+        # Rooms whose counter this worker has made sure exists
+        self._seeded: Set[int] = set()
+
+    @staticmethod
+    def _key(room_id: int) -> str:
+        return f"{KEY_PREFIX}{room_id}"
+
+    async def next(self, room_id: int) -> int:
+        """Reserve the sequence number of a new message"""
+        if room_id not in self._seeded:
+            await self._seed(room_id)
+        return await self.redis.incr(self._key(room_id))
+
+    async def current(self, room_ids: Iterable[int]) -> Dict[int, int]:
+        """Latest sequence number of each room, 0 for rooms without one"""
+        room_ids = list(room_ids)
+        if not room_ids:
+            return {}
+        counters = await self.redis.mget(
+            [self._key(room_id) for room_id in room_ids]
+        )
+        sequences = {}
+        for room_id, counter in zip(room_ids, counters):
+            if counter is None:
+                # Counter lost (or never used); fall back to the database
+                counter = await self._seed(room_id)
+            sequences[room_id] = int(counter)
+        return sequences
+
+    async def _seed(self, room_id: int) -> int:
+        """
+        Create a missing counter from the highest stored sequence. Every
+        partition is read, as a quiet room's last messages may be old;
+        read markers cover rooms whose messages were all archived.
+        """
+        async with self.session_factory() as session:
+            stored = await session.scalar(
+                select(func.greatest(
+                    select(func.max(Message.seq))
+                    .where(Message.room_id == room_id)
+                    .scalar_subquery(),
+                    select(func.max(ChatParticipant.last_read_seq))
+                    .where(ChatParticipant.room_id == room_id)
+                    .scalar_subquery()
+                ))
+            )
+        # NX: never move a live counter backwards
+        await self.redis.set(self._key(room_id), stored or 0, nx=True)
+        self._seeded.add(room_id)
+        return int(await self.redis.get(self._key(room_id)) or 0)
+
+
+class ReadMarkerWriter:
+    """Buffers read markers and writes the newest per participant"""
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        flush_interval: float = settings.chat_read_marker_flush_interval_ms / 1000
+    ):
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval
+        # (room_id, user_id) -> (message_id, seq)
+        self._pending: Dict[Tuple[int, int], Tuple[int, int]] = {}
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def mark(self, room_id: int, user_id: int, message_id: int, seq: int):
+        """Record that a user has read up to a message; never moves back"""
+        key = (room_id, user_id)
+        pending = self._pending.get(key)
+        if pending is None or pending[1] < seq:
+            self._pending[key] = (message_id, seq)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def pending_seq(self, room_id: int, user_id: int) -> Optional[int]:
+        """Marker not yet written to the database, if any"""
+        pending = self._pending.get((room_id, user_id))
+        return pending[1] if pending is not None else None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self) -> bool:
+        """Write out buffered markers; returns False if the write failed"""
+        async with self._lock:
+            if not self._pending:
+                return True
+            batch, self._pending = self._pending, {}
+            rows = [
+                (room_id, user_id, message_id, seq)
+                for (room_id, user_id), (message_id, seq) in batch.items()
+            ]
+            try:
+                await self._write(rows)
+            except Exception as e:
+                if isinstance(e, DBAPIError) and not is_transient_error(e):
+                    # A bad marker must not be retried with the whole batch
+                    unwritten = await self._write_each(rows)
+                    self._requeue({
+                        (room_id, user_id): (message_id, seq)
+                        for room_id, user_id, message_id, seq in unwritten
+                    })
+                    return not unwritten
+                logger.error(
+                    f"Error writing {len(rows)} read markers, will retry: {e}"
+                )
+                self._requeue(batch)
+                return False
+            return True
+
+    def _requeue(self, batch: Dict[Tuple[int, int], Tuple[int, int]]):
+        # Keep newer markers recorded while we were writing
+        for key, marker in batch.items():
+            pending = self._pending.get(key)
+            if pending is None or pending[1] < marker[1]:
+                self._pending[key] = marker
+
+    async def _write(self, rows: List[Tuple[int, int, int, int]]):
+        markers = values(
+            column("room_id", Integer),
+            column("user_id", Integer),
+            column("message_id", Integer),
+            column("seq", BigInteger),
+            name="markers"
+        ).data(rows)
+        stmt = (
+            update(ChatParticipant)
+            .where(
+                ChatParticipant.room_id == markers.c.room_id,
+                ChatParticipant.user_id == markers.c.user_id,
+                # Out-of-order flushes from several workers
+                ChatParticipant.last_read_seq < markers.c.seq
+            )
+            .values(
+                last_read_message_id=markers.c.message_id,
+                last_read_seq=markers.c.seq
+            )
+        )
+        async with self.session_factory() as session:
+            await session.execute(stmt)
+            await session.commit()
+
+    async def _write_each(
+        self, rows: List[Tuple[int, int, int, int]]
+    ) -> List[Tuple[int, int, int, int]]:
+        """
+        Write markers one at a time, dropping the ones the database rejects.
+        Returns the markers left unwritten by a database outage.
+        """
+        for index, row in enumerate(rows):
+            try:
+                await self._write([row])
+            except DBAPIError as e:
+                if is_transient_error(e):
+                    logger.error(f"Error writing read markers, will retry: {e}")
+                    return rows[index:]
+                logger.error(
+                    f"Dropping read marker of user {row[1]} "
+                    f"in room {row[0]}: {e}"
+                )
+        return []
+
+    async def stop(self):
+        """Stop the flusher and write out what is still buffered"""
+        if self._task is not None:
+            async with self._lock:
+                self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if not await self.flush():
+            logger.error(
+                f"Shutting down with {len(self._pending)} unsaved read markers"
+            )
+
+
+def create_room_sequences() -> RoomSequences:
+    from redis_client import async_redis_client
+    return RoomSequences(async_redis_client)
+
+
+# Global sequence counters and read marker buffer
+room_sequences = create_room_sequences()
+read_markers = ReadMarkerWriter()
@@ -0,0 +1,147 @@
+"""
+Pool of pre-warmed OpenAI Realtime API connections.
+
+Opening a realtime connection and applying the session configuration
+takes a few round trips. That used to happen while the user waited, so
+the pool keeps a few connections open and already configured. A voice
+session takes one on connect. Realtime sessions hold their conversation,
+so a connection is never reused: it is closed when the voice session
+ends and the pool opens a fresh one in the background. Warm connections
+idle longer than idle_timeout are closed and replaced before the server
+expires them.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait before retrying after a failed warm-up, doubled after
+# each further failure in a row
+RETRY_DELAY = 5.0
+MAX_RETRY_DELAY = 60.0
+
+
+class RealtimeConnectionPool:
+    def __init__(
+        self,
+        client,
+        session_config: Dict,
+        model: str = settings.openai_realtime_model,
+        size: int = settings.voice_pool_size,
+        idle_timeout: float = settings.voice_pool_idle_timeout
+    ):
+        self.client = client
+        self.session_config = session_config
+        self.model = model
+        self.size = size
+        self.idle_timeout = idle_timeout
+        # (connection, monotonic time it was warmed), oldest first
+        self._idle: Deque[Tuple[object, float]] = deque()
+        self._refill_task: Optional[asyncio.Task] = None
+        self._reaper_task: Optional[asyncio.Task] = None
+        self._closed = False
+        self.counters: Dict[str, int] = {
+            "hits": 0,
+            "misses": 0,
+            "opened": 0,
+            "expired": 0,
+            "failures": 0
+        }
+
+    async def start(self):
+        """Start warming connections and expiring idle ones"""
+        self._closed = False
+        if self.size > 0 and self._reaper_task is None:
+            self._reaper_task = asyncio.create_task(self._reap())
+        self._schedule_refill()
+
+    async def acquire(self):
+        """A configured connection, warm if one is available"""
+        await self._expire()
+        if self._idle:
+            connection, _ = self._idle.popleft()
+            self.counters["hits"] += 1
+        else:
+            self.counters["misses"] += 1
+            connection = await self._open()
+        self._schedule_refill()
+        return connection
+
+    async def release(self, connection):
+        """Close a connection handed out by acquire"""
+        try:
+            await connection.close()
+        except Exception as e:
+            logger.error(f"Error closing realtime connection: {e}")
+
+    async def _open(self):
+        connection = await self.client.beta.realtime.connect(
+            model=self.model
+        ).enter()
+        try:
+            await connection.session.update(session=self.session_config)
+        except BaseException:
+            await connection.close()
+            raise
+        self.counters["opened"] += 1
+        return connection
+
+    def _schedule_refill(self):
+        if self._closed or self.size <= 0:
+            return
+        if self._refill_task is None or self._refill_task.done():
+            self._refill_task = asyncio.create_task(self._refill())
+
+    async def _refill(self):
+        delay = RETRY_DELAY
+        while not self._closed and len(self._idle) < self.size:
+            try:
+                connection = await self._open()
+            except Exception as e:
+                self.counters["failures"] += 1
+                logger.error(
+                    f"Error warming realtime connection, retrying in "
+                    f"{delay:.0f}s: {e}"
+                )
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+                continue
+            delay = RETRY_DELAY
+            if self._closed:
+                await self.release(connection)
+                return
+            self._idle.append((connection, time.monotonic()))
+
+    async def _reap(self):
+        interval = max(1.0, min(self.idle_timeout / 2, 30.0))
+        while True:
+            await asyncio.sleep(interval)
+            await self._expire()
+            self._schedule_refill()
+
+    async def _expire(self):
+        cutoff = time.monotonic() - self.idle_timeout
+        while self._idle and self._idle[0][1] < cutoff:
+            connection, _ = self._idle.popleft()
+            self.counters["expired"] += 1
+            await self.release(connection)
+
+    async def close(self):
+        """Stop refilling and close every warm connection"""
+        self._closed = True
+        tasks = [t for t in (self._refill_task, self._reaper_task) if t]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._refill_task = self._reaper_task = None
+        while self._idle:
+            connection, _ = self._idle.popleft()
+            await self.release(connection)
+
+    def get_stats(self) -> Dict:
+        return {**self.counters, "size": self.size, "idle": len(self._idle)}
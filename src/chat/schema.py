@@ -1,10 +1,18 @@
-from sqlalchemy import (Boolean, Column, DateTime, ForeignKey, Integer, String,
-                        Text)
-from sqlalchemy.orm import relationship
+from sqlalchemy import (BigInteger, Boolean, Column, Computed, DateTime,
+                        ForeignKey, Index, Integer, String, Text)
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import deferred, relationship
 from sqlalchemy.sql import func
 
 from database import Base
 
+# Length of chat_rooms.last_message_preview
+PREVIEW_LENGTH = 200
+
+# Text search configuration of messages.search_vector. "simple" doesn't
+# stem, which suits multilingual chat; changing it needs a migration.
+SEARCH_CONFIG = "simple"
+
 
 class ChatRoom(Base):
     __tablename__ = "chat_rooms"
@@ -13,8 +21,15 @@ class ChatRoom(Base):
     name = Column(String(100), nullable=False)
     description = Column(Text, nullable=True)
     is_public = Column(Boolean, default=True)
+    # Opt-in micro-batching of outbound frames; NULL disables it
+    batch_window_ms = Column(Integer, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # Summary for room lists, kept up to date on join and message insert
+    member_count = Column(Integer, nullable=False, server_default="0")
+    last_message_id = Column(Integer, nullable=True)
+    last_message_preview = Column(String(PREVIEW_LENGTH), nullable=True)
+    last_message_at = Column(DateTime(timezone=True), nullable=True)
 
     # Relationships
     messages = relationship(
@@ -24,8 +39,20 @@ class ChatRoom(Base):
         "ChatParticipant", back_populates="room", cascade="all, delete-orphan"
     )
 
+    __table_args__ = (
+        # Keyset pagination of the room list
+        Index("ix_chat_rooms_created_id", "created_at", "id"),
+        # Substring search on names (pg_trgm)
+        Index(
+            "ix_chat_rooms_name_trgm", "name",
+            postgresql_using="gin",
+            postgresql_ops={"name": "gin_trgm_ops"}
+        ),
+    )
+
 
 class Message(Base):
+    # Range-partitioned by month on created_at, see chat/partitions.py
     __tablename__ = "messages"
 
     id = Column(Integer, primary_key=True, index=True)
@@ -33,10 +60,32 @@ class Message(Base):
     room_id = Column(Integer, ForeignKey("chat_rooms.id"), nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     message_type = Column(String(20), default="text")
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Position in the room, from the Redis counter in chat/read_markers.py
+    seq = Column(BigInteger, nullable=True)
+    # Partition key, so part of the primary key
+    created_at = Column(
+        DateTime(timezone=True), primary_key=True, server_default=func.now()
+    )
+    # Maintained by Postgres; never written by the application
+    search_vector = deferred(Column(
+        TSVECTOR,
+        Computed(f"to_tsvector('{SEARCH_CONFIG}', content)", persisted=True)
+    ))
     room = relationship("ChatRoom", back_populates="messages")
     user = relationship("User", back_populates="messages")
 
+    __table_args__ = (
+        # Keyset pagination of a room's history
+        Index("ix_messages_room_created_id", "room_id", "created_at", "id"),
+        # Seeding a room's sequence counter, see chat/read_markers.py
+        Index("ix_messages_room_seq", "room_id", "seq"),
+        Index(
+            "ix_messages_search_vector", "search_vector",
+            postgresql_using="gin"
+        ),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
 
 class ChatParticipant(Base):
     __tablename__ = "chat_participants"
@@ -45,5 +94,15 @@ class ChatParticipant(Base):
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     joined_at = Column(DateTime(timezone=True), server_default=func.now())
     is_admin = Column(Boolean, default=False)
+    # Read marker: unread count = room sequence - last_read_seq
+    last_read_message_id = Column(Integer, nullable=True)
+    last_read_seq = Column(BigInteger, nullable=False, server_default="0")
     room = relationship("ChatRoom", back_populates="participants")
     user = relationship("User", back_populates="chat_participations")
+
+    __table_args__ = (
+        Index(
+            "ux_chat_participants_room_user", "room_id", "user_id",
+            unique=True
+        ),
+    )
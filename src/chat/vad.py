@@ -0,0 +1,121 @@
+"""
+Voice activity detection for inbound voice audio.
+
+PCM16 is cut into short frames. A frame counts as speech when it is loud
+enough and its zero-crossing rate is below the level of broadband hiss;
+both features are computed for all frames of a chunk at once with NumPy.
+Silent frames are dropped instead of being sent to the Realtime API,
+except for a hangover after speech (so upstream turn detection still
+hears the pause that ends a turn) and a pre-roll before it (so word
+onsets are not clipped).
+"""
+import math
+from collections import deque
+from typing import Deque, Dict, List
+
+import numpy as np
+
+from config import settings
+
+from .audio_buffer import INPUT_SAMPLE_RATE, SAMPLE_WIDTH
+
+# Mean square of a full-scale PCM16 signal, the 0 dBFS reference
+FULL_SCALE = 32768.0 ** 2
+
+
+class VoiceActivityDetector:
+    """Per-session silence suppression with hangover and pre-roll"""
+
+    def __init__(
+        self,
+        frame_ms: int = settings.voice_vad_frame_ms,
+        energy_threshold_db: float = settings.voice_vad_energy_threshold_db,
+        zcr_threshold: float = settings.voice_vad_zcr_threshold,
+        hangover_ms: int = settings.voice_vad_hangover_ms,
+        preroll_ms: int = settings.voice_vad_preroll_ms,
+        sample_rate: int = INPUT_SAMPLE_RATE
+    ):
+        self.frame_samples = max(2, sample_rate * frame_ms // 1000)
+        self.frame_size = self.frame_samples * SAMPLE_WIDTH
+        # Compare mean squares instead of taking a log of every frame
+        self.energy_threshold = FULL_SCALE * 10 ** (energy_threshold_db / 10)
+        self.zcr_threshold = zcr_threshold
+        self.hangover_frames = math.ceil(hangover_ms / frame_ms)
+        # Most recent silent frames, sent ahead of the next speech
+        self._preroll: Deque[memoryview] = deque(
+            maxlen=math.ceil(preroll_ms / frame_ms)
+        )
+        self._remainder = b""
+        self._hangover = 0
+        self.counters: Dict[str, int] = {
+            "frames_in": 0,
+            "speech_frames": 0,
+            "forwarded_frames": 0
+        }
+
+    @property
+    def active(self) -> bool:
+        """True while speech or its hangover is being forwarded"""
+        return self._hangover > 0
+
+    def classify(self, samples: np.ndarray) -> np.ndarray:
+        """Speech flags of a (frames, frame_samples) int16 array"""
+        x = samples.astype(np.float32)
+        energy = np.einsum("ij,ij->i", x, x) / self.frame_samples
+        signs = np.signbit(samples)
+        crossings = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1)
+        zcr = crossings / (self.frame_samples - 1)
+        return (energy >= self.energy_threshold) & (zcr <= self.zcr_threshold)
+
+    def process(self, chunk) -> List[memoryview]:
+        """Split a chunk of PCM16 into frames and return those to forward"""
+        data = memoryview(chunk).cast("B")
+        if self._remainder:
+            data = memoryview(self._remainder + data)
+        count = len(data) // self.frame_size
+        whole = count * self.frame_size
+        self._remainder = bytes(data[whole:])
+        if not count:
+            return []
+        samples = np.frombuffer(
+            data, dtype="<i2", count=count * self.frame_samples
+        ).reshape(count, self.frame_samples)
+        speech = self.classify(samples)
+        self.counters["frames_in"] += count
+        self.counters["speech_frames"] += int(np.count_nonzero(speech))
+
+        forwarded = []
+        for index, is_speech in enumerate(speech.tolist()):
+            frame = data[index * self.frame_size:(index + 1) * self.frame_size]
+            if is_speech:
+                forwarded.extend(self._preroll)
+                self._preroll.clear()
+                self._hangover = self.hangover_frames + 1
+            if self._hangover > 0:
+                self._hangover -= 1
+                forwarded.append(frame)
+            else:
+                self._preroll.append(frame)
+        self.counters["forwarded_frames"] += len(forwarded)
+        return forwarded
+
+    def flush(self) -> List[memoryview]:
+        """Partial frame left over, forwarded only while speech is active"""
+        remainder, self._remainder = self._remainder, b""
+        if remainder and self.active:
+            return [memoryview(remainder)]
+        return []
+
+    def get_stats(self) -> Dict:
+        frames_in = self.counters["frames_in"]
+        suppressed = (
+            frames_in - self.counters["forwarded_frames"] - len(self._preroll)
+        )
+        return {
+            **self.counters,
+            "suppressed_frames": suppressed,
+            "suppression_ratio": suppressed / frames_in if frames_in else 0.0,
+            "speech_ratio": (
+                self.counters["speech_frames"] / frames_in if frames_in else 0.0
+            )
+        }
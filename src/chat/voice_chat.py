@@ -2,58 +2,138 @@ import asyncio
 import json
 import logging
 import base64
-from typing import Dict, Optional
-from fastapi import WebSocket
+from typing import Dict, List, Optional, Tuple
+from fastapi import WebSocket, WebSocketDisconnect
 from openai import AsyncOpenAI
 from config import settings
 
+from .audio_buffer import AudioInputBuffer
+from .audio_format import REALTIME_FORMAT, AudioConverter, AudioFormat
+from .realtime_pool import RealtimeConnectionPool
+from .voice_metrics import voice_metrics
+from .vad import VoiceActivityDetector
+
 logger = logging.getLogger(__name__)
 
+# Subprotocols of /chat/voice/{room_id}. With "voice.pcm16" audio travels
+# as binary frames of raw PCM (s16:24000:1 unless the client negotiated
+# another format) in both directions; without it (legacy clients) as
+# base64 in JSON "audio_data"/"audio_delta" events. Control events are
+# JSON text frames either way.
+BINARY_AUDIO_SUBPROTOCOL = "voice.pcm16"
+JSON_AUDIO_SUBPROTOCOL = "voice.json"
+
+# Client event types counted under their own name in the metrics
+CLIENT_EVENT_TYPES = {
+    'audio_data', 'audio_commit', 'text_message', 'interrupt', 'end_session'
+}
+
+
+def negotiate_audio_protocol(offered: List[str]) -> Tuple[bool, Optional[str]]:
+    """Returns (binary audio, subprotocol to echo back or None)"""
+    if BINARY_AUDIO_SUBPROTOCOL in offered:
+        return True, BINARY_AUDIO_SUBPROTOCOL
+    if JSON_AUDIO_SUBPROTOCOL in offered:
+        return False, JSON_AUDIO_SUBPROTOCOL
+    return False, None
+
+
+# Applied to every realtime connection before it is handed to a user
+SESSION_CONFIG = {
+    'modalities': ['audio', 'text'],
+    'instructions': 'You are a helpful voice assistant. Respond naturally and conversationally.',
+    'voice': 'alloy',
+    'input_audio_format': 'pcm16',
+    'output_audio_format': 'pcm16',
+    'input_audio_transcription': {
+        'model': 'whisper-1'
+    }
+}
+
+
 class VoiceChatManager:
     def __init__(self):
-        self.openai_client = AsyncOpenAI(api_key=settings.openai_api_key)
+        self.openai_client = AsyncOpenAI(
+            api_key=settings.openai_api_key,
+            # e.g. a local fake realtime server for load tests
+            websocket_base_url=settings.openai_realtime_url
+        )
+        self.pool = RealtimeConnectionPool(self.openai_client, SESSION_CONFIG)
         self.active_voice_sessions: Dict[str, Dict] = {}
+
+    async def start(self):
+        """Start warming realtime connections"""
+        await self.pool.start()
+
+    async def shutdown(self):
+        """End every voice session and close warm connections"""
+        for session_id in list(self.active_voice_sessions):
+            await self._cleanup_session(session_id)
+        await self.pool.close()
         
-    async def start_voice_session(self, websocket: WebSocket, session_id: str, user_id: int):
+    async def start_voice_session(
+        self,
+        websocket: WebSocket,
+        session_id: str,
+        user_id: int,
+        binary_audio: bool = False,
+        input_format: AudioFormat = REALTIME_FORMAT,
+        output_format: AudioFormat = REALTIME_FORMAT
+    ):
         """Start a new voice chat session with OpenAI Realtime API"""
+        connection = None
         try:
-            # Connect to OpenAI Realtime API
-            async with self.openai_client.beta.realtime.connect(
-                model="gpt-4o-realtime-preview"
-            ) as connection:
-                
-                # Configure session for audio
-                await connection.session.update(session={
-                    'modalities': ['audio', 'text'],
-                    'instructions': 'You are a helpful voice assistant. Respond naturally and conversationally.',
-                    'voice': 'alloy',
-                    'input_audio_format': 'pcm16',
-                    'output_audio_format': 'pcm16',
-                    'input_audio_transcription': {
-                        'model': 'whisper-1'
-                    }
-                })
+            # Connect to OpenAI Realtime API; pooled connections are
+            # already configured with SESSION_CONFIG
+            connection = await self.pool.acquire()
                 
-                # Store session info
-                self.active_voice_sessions[session_id] = {
-                    'connection': connection,
-                    'websocket': websocket,
-                    'user_id': user_id,
-                    'is_active': True
-                }
-                
-                logger.info(f"Voice session {session_id} started for user {user_id}")
-                
-                # Handle OpenAI events and WebSocket messages concurrently
-                await asyncio.gather(
-                    self._handle_openai_events(session_id, connection),
-                    self._handle_websocket_messages(session_id, websocket, connection),
-                    return_exceptions=True
+            # Store session info
+            self.active_voice_sessions[session_id] = {
+                'connection': connection,
+                'websocket': websocket,
+                'user_id': user_id,
+                'binary_audio': binary_audio,
+                # Client format <-> the Realtime API's 24 kHz mono PCM16
+                'input_converter': AudioConverter(input_format, REALTIME_FORMAT),
+                'output_converter': AudioConverter(REALTIME_FORMAT, output_format),
+                'input_buffer': AudioInputBuffer(
+                    lambda audio: connection.input_audio_buffer.append(audio=audio)
+                ),
+                'vad': (
+                    VoiceActivityDetector()
+                    if settings.voice_vad_enabled else None
+                ),
+                # Frames for the client; the OpenAI event loop waits when
+                # it is full instead of buffering without bound
+                'send_queue': asyncio.Queue(settings.voice_send_queue_size),
+                'metrics': voice_metrics.session(),
+                'is_active': True
+            }
+            session = self.active_voice_sessions[session_id]
+            session['writer'] = asyncio.create_task(
+                self._write_loop(session_id, session)
+            )
+            
+            logger.info(f"Voice session {session_id} started for user {user_id}")
+            
+            # Handle OpenAI events and WebSocket messages concurrently;
+            # _cleanup_session cancels them when the session is ended
+            session['tasks'] = [
+                asyncio.create_task(
+                    self._handle_openai_events(session_id, connection)
+                ),
+                asyncio.create_task(
+                    self._handle_websocket_messages(session_id, websocket, connection)
                 )
+            ]
+            await asyncio.gather(*session['tasks'], return_exceptions=True)
                 
         except Exception as e:
             logger.error(f"Error in voice session {session_id}: {e}")
             await self._cleanup_session(session_id)
+        finally:
+            if connection is not None:
+                await self.pool.release(connection)
             
     async def _handle_openai_events(self, session_id: str, connection):
         """Handle events from OpenAI Realtime API"""
@@ -63,58 +143,72 @@ class VoiceChatManager:
                     break
                     
                 session = self.active_voice_sessions[session_id]
-                websocket = session['websocket']
+                metrics = session['metrics']
+                metrics.upstream_event(event.type)
                 
                 if event.type == 'response.audio.delta':
-                    # Send audio data to client
-                    audio_data = base64.b64encode(event.delta).decode('utf-8')
-                    await websocket.send_text(json.dumps({
-                        'type': 'audio_delta',
-                        'audio': audio_data
-                    }))
+                    metrics.audio_delta()
+                    # event.delta is already base64 PCM16
+                    converter = session['output_converter']
+                    if session['binary_audio']:
+                        audio = converter.convert(base64.b64decode(event.delta))
+                        metrics.audio_out(len(audio))
+                        await self._send(session, audio)
+                    else:
+                        audio = event.delta
+                        if not converter.identity:
+                            audio = base64.b64encode(
+                                converter.convert(base64.b64decode(audio))
+                            ).decode('ascii')
+                        metrics.audio_out(len(audio) * 3 // 4)
+                        await self._send(session, json.dumps({
+                            'type': 'audio_delta',
+                            'audio': audio
+                        }))
                     
                 elif event.type == 'response.audio.done':
                     # Audio response completed
-                    await websocket.send_text(json.dumps({
+                    await self._send(session, json.dumps({
                         'type': 'audio_done'
                     }))
                     
                 elif event.type == 'response.text.delta':
                     # Send text transcription to client
-                    await websocket.send_text(json.dumps({
+                    await self._send(session, json.dumps({
                         'type': 'text_delta',
                         'text': event.delta
                     }))
                     
                 elif event.type == 'response.text.done':
                     # Text response completed
-                    await websocket.send_text(json.dumps({
+                    await self._send(session, json.dumps({
                         'type': 'text_done',
                         'text': event.text
                     }))
                     
                 elif event.type == 'input_audio_buffer.speech_started':
                     # User started speaking
-                    await websocket.send_text(json.dumps({
+                    await self._send(session, json.dumps({
                         'type': 'speech_started'
                     }))
                     
                 elif event.type == 'input_audio_buffer.speech_stopped':
                     # User stopped speaking
-                    await websocket.send_text(json.dumps({
+                    metrics.speech_stopped()
+                    await self._send(session, json.dumps({
                         'type': 'speech_stopped'
                     }))
                     
                 elif event.type == 'conversation.item.input_audio_transcription.completed':
                     # User's speech transcription completed
-                    await websocket.send_text(json.dumps({
+                    await self._send(session, json.dumps({
                         'type': 'user_transcription',
                         'text': event.transcript
                     }))
                     
                 elif event.type == 'error':
                     logger.error(f"OpenAI API error in session {session_id}: {event.error}")
-                    await websocket.send_text(json.dumps({
+                    await self._send(session, json.dumps({
                         'type': 'error',
                         'message': str(event.error)
                     }))
@@ -124,19 +218,38 @@ class VoiceChatManager:
             
     async def _handle_websocket_messages(self, session_id: str, websocket: WebSocket, connection):
         """Handle messages from WebSocket client"""
+        session = self.active_voice_sessions[session_id]
         try:
             while session_id in self.active_voice_sessions:
                 try:
-                    data = await websocket.receive_text()
-                    message = json.loads(data)
+                    frame = await websocket.receive()
+                    if frame['type'] == 'websocket.disconnect':
+                        raise WebSocketDisconnect(frame.get('code', 1000))
+                    if frame.get('bytes') is not None:
+                        # Binary frame: raw PCM, no JSON or base64 on our side
+                        session['metrics'].client_event('audio_frame')
+                        await self._append_audio(session, frame['bytes'])
+                        continue
+                    message = json.loads(frame['text'])
+                    message_type = message.get('type')
+                    session['metrics'].client_event(
+                        message_type if message_type in CLIENT_EVENT_TYPES
+                        else 'other'
+                    )
                     
                     if message.get('type') == 'audio_data':
-                        # Receive audio data from client and send to OpenAI
-                        audio_bytes = base64.b64decode(message['audio'])
-                        await connection.input_audio_buffer.append(audio=audio_bytes)
+                        # Legacy clients send base64; decode it into the buffer
+                        audio = message.get('audio')
+                        if not isinstance(audio, str):
+                            raise ValueError('audio_data needs base64 audio')
+                        await self._append_audio(
+                            session, base64.b64decode(audio)
+                        )
                         
                     elif message.get('type') == 'audio_commit':
                         # Commit audio buffer and generate response
+                        await self._flush_audio(session)
+                        session['metrics'].committed()
                         await connection.input_audio_buffer.commit()
                         await connection.response.create()
                         
@@ -153,6 +266,7 @@ class VoiceChatManager:
                         
                     elif message.get('type') == 'interrupt':
                         # Interrupt current response
+                        await self._flush_audio(session)
                         await connection.response.cancel()
                         
                     elif message.get('type') == 'end_session':
@@ -162,17 +276,75 @@ class VoiceChatManager:
                         
                 except json.JSONDecodeError:
                     logger.error(f"Invalid JSON received in voice session {session_id}")
+                except WebSocketDisconnect:
+                    raise
                 except Exception as e:
                     logger.error(f"Error processing WebSocket message in session {session_id}: {e}")
                     
+        except WebSocketDisconnect:
+            logger.info(f"Voice session {session_id} client disconnected")
+            await self._cleanup_session(session_id)
         except Exception as e:
             logger.error(f"Error in WebSocket handler for session {session_id}: {e}")
+
+    async def _append_audio(self, session: Dict, audio: bytes):
+        """Queue a chunk of client audio for the Realtime API"""
+        pcm16 = session['input_converter'].convert(audio)
+        session['metrics'].audio_in(len(audio))
+        # Copied once into the session's frame buffer, which is base64
+        # encoded for the Realtime API when full or on its deadline
+        input_buffer = session['input_buffer']
+        vad = session['vad']
+        if vad is None:
+            await input_buffer.write(memoryview(pcm16))
+            return
+        for frame in vad.process(pcm16):
+            await input_buffer.write(frame)
+
+    async def _flush_audio(self, session: Dict):
+        """Send everything buffered for the session upstream now"""
+        if session['vad'] is not None:
+            for frame in session['vad'].flush():
+                await session['input_buffer'].write(frame)
+        await session['input_buffer'].flush()
+            
+    async def _send(self, session: Dict, frame):
+        """Queue a text (str) or binary (bytes) frame for the client"""
+        if session['writer'].done():
+            # The client is gone or the session has ended
+            return
+        queue = session['send_queue']
+        await queue.put(frame)
+        session['metrics'].queue_changed(queue.qsize(), enqueued=True)
+
+    async def _write_loop(self, session_id: str, session: Dict):
+        """Send queued frames to the client in order"""
+        websocket = session['websocket']
+        queue = session['send_queue']
+        metrics = session['metrics']
+        try:
+            while True:
+                frame = await queue.get()
+                metrics.queue_changed(queue.qsize())
+                if isinstance(frame, str):
+                    await websocket.send_text(frame)
+                else:
+                    await websocket.send_bytes(frame)
+        except Exception as e:
+            logger.error(f"Error sending to client in voice session {session_id}: {e}")
             
     async def _cleanup_session(self, session_id: str):
         """Clean up voice session"""
         if session_id in self.active_voice_sessions:
             session = self.active_voice_sessions[session_id]
             session['is_active'] = False
+            session['input_buffer'].close()
+            session['metrics'].close()
+            session['writer'].cancel()
+            # Unblocks the OpenAI event loop if it waits on a full queue
+            queue = session['send_queue']
+            while not queue.empty():
+                queue.get_nowait()
             
             try:
                 # Send session end message to client
@@ -183,6 +355,18 @@ class VoiceChatManager:
                 logger.error(f"Error sending session end message: {e}")
                 
             del self.active_voice_sessions[session_id]
+            
+            # Ends the OpenAI event loop, which would otherwise wait forever,
+            # and stops reading from the client, so start_voice_session
+            # returns and releases the connection
+            try:
+                await session['connection'].close()
+            except Exception as e:
+                logger.error(f"Error closing realtime connection: {e}")
+            current = asyncio.current_task()
+            for task in session.get('tasks', ()):
+                if task is not current:
+                    task.cancel()
             logger.info(f"Voice session {session_id} cleaned up")
             
     async def end_session(self, session_id: str):
@@ -191,7 +375,15 @@ class VoiceChatManager:
         
     def get_active_sessions(self) -> Dict[str, Dict]:
         """Get all active voice sessions"""
-        return {sid: {'user_id': session['user_id'], 'is_active': session['is_active']} 
+        return {sid: {'user_id': session['user_id'],
+                      'is_active': session['is_active'],
+                      'binary_audio': session['binary_audio'],
+                      'input_format': str(session['input_converter'].source),
+                      'output_format': str(session['output_converter'].target),
+                      'input_audio': session['input_buffer'].get_stats(),
+                      'vad': (session['vad'].get_stats()
+                              if session['vad'] is not None else None),
+                      'metrics': session['metrics'].get_stats()}
                 for sid, session in self.active_voice_sessions.items()}
 
 # Global voice chat manager instance
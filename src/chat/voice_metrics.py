@@ -0,0 +1,243 @@
+"""
+Latency and throughput metrics of voice sessions.
+
+Each session tracks its own numbers:
+- time from audio_commit to the first response.audio.delta;
+- time from speech_stopped to the first response.audio.delta;
+- audio bytes in and out;
+- events by type;
+- depth of the downstream send queue.
+GET /chat/voice/sessions reports them. The latencies and queue depths are
+also aggregated per worker into histograms that GET /chat/voice/metrics
+serves in the Prometheus text format.
+"""
+import bisect
+import time
+from typing import Dict, List, Optional, Tuple
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0)
+QUEUE_DEPTH_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250)
+
+
+class Histogram:
+    """Fixed-bucket histogram with Prometheus semantics"""
+
+    __slots__ = ("name", "help", "buckets", "counts", "sum", "count")
+
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...]):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        # One count per bucket plus +Inf; made cumulative when rendered
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} histogram"
+        ]
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{self.name}_sum {self.sum}")
+        lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+
+class LatencyStats:
+    """Count, last, mean and max of one session's latency samples"""
+
+    __slots__ = ("count", "total", "last", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.last: Optional[float] = None
+        self.max = 0.0
+
+    def add(self, value: float):
+        self.count += 1
+        self.total += value
+        self.last = value
+        self.max = max(self.max, value)
+
+    def to_dict(self) -> Dict:
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "last_ms": self.last * 1000,
+            "mean_ms": self.total / self.count * 1000,
+            "max_ms": self.max * 1000
+        }
+
+
+class VoiceMetrics:
+    """Aggregate voice metrics of this worker"""
+
+    def __init__(self):
+        self.commit_to_first_audio = Histogram(
+            "voice_commit_to_first_audio_seconds",
+            "Time from audio_commit to the first response.audio.delta",
+            LATENCY_BUCKETS
+        )
+        self.speech_stopped_to_first_audio = Histogram(
+            "voice_speech_stopped_to_first_audio_seconds",
+            "Time from speech_stopped to the first response.audio.delta",
+            LATENCY_BUCKETS
+        )
+        self.send_queue_depth = Histogram(
+            "voice_send_queue_depth",
+            "Downstream send queue depth, sampled on every enqueue",
+            QUEUE_DEPTH_BUCKETS
+        )
+        self.audio_bytes = {"in": 0, "out": 0}
+        # (source, event type) -> count
+        self.events: Dict[Tuple[str, str], int] = {}
+        self.sessions_started = 0
+        self.active_sessions = 0
+
+    def session(self) -> "VoiceSessionMetrics":
+        self.sessions_started += 1
+        self.active_sessions += 1
+        return VoiceSessionMetrics(self)
+
+    def render(self) -> str:
+        lines = [
+            "# HELP voice_sessions_started_total Voice sessions started",
+            "# TYPE voice_sessions_started_total counter",
+            f"voice_sessions_started_total {self.sessions_started}",
+            "# HELP voice_active_sessions Voice sessions open now",
+            "# TYPE voice_active_sessions gauge",
+            f"voice_active_sessions {self.active_sessions}",
+            "# HELP voice_audio_bytes_total Audio bytes from and to clients",
+            "# TYPE voice_audio_bytes_total counter"
+        ]
+        for direction, count in self.audio_bytes.items():
+            lines.append(
+                f'voice_audio_bytes_total{{direction="{direction}"}} {count}'
+            )
+        lines += [
+            "# HELP voice_events_total Events from clients and the Realtime API",
+            "# TYPE voice_events_total counter"
+        ]
+        for (source, event_type), count in sorted(self.events.items()):
+            lines.append(
+                f'voice_events_total{{source="{source}",type="{event_type}"}} '
+                f"{count}"
+            )
+        for histogram in (
+            self.commit_to_first_audio,
+            self.speech_stopped_to_first_audio,
+            self.send_queue_depth
+        ):
+            lines += histogram.render()
+        return "\n".join(lines) + "\n"
+
+
+class VoiceSessionMetrics:
+    """Metrics of one voice session, also fed into the worker aggregate"""
+
+    __slots__ = (
+        "aggregate", "started_at", "audio_bytes_in", "audio_bytes_out",
+        "client_events", "upstream_events", "queue_depth", "max_queue_depth",
+        "commit_to_first_audio", "speech_stopped_to_first_audio",
+        "_committed_at", "_speech_stopped_at", "_closed"
+    )
+
+    def __init__(self, aggregate: VoiceMetrics):
+        self.aggregate = aggregate
+        self.started_at = time.monotonic()
+        self.audio_bytes_in = 0
+        self.audio_bytes_out = 0
+        self.client_events: Dict[str, int] = {}
+        self.upstream_events: Dict[str, int] = {}
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.commit_to_first_audio = LatencyStats()
+        self.speech_stopped_to_first_audio = LatencyStats()
+        # Monotonic times waiting for the next audio delta
+        self._committed_at: Optional[float] = None
+        self._speech_stopped_at: Optional[float] = None
+        self._closed = False
+
+    def _count(self, source: str, counts: Dict[str, int], event_type: str):
+        counts[event_type] = counts.get(event_type, 0) + 1
+        key = (source, event_type)
+        events = self.aggregate.events
+        events[key] = events.get(key, 0) + 1
+
+    def client_event(self, event_type: str):
+        self._count("client", self.client_events, event_type)
+
+    def upstream_event(self, event_type: str):
+        self._count("upstream", self.upstream_events, event_type)
+
+    def audio_in(self, size: int):
+        self.audio_bytes_in += size
+        self.aggregate.audio_bytes["in"] += size
+
+    def audio_out(self, size: int):
+        self.audio_bytes_out += size
+        self.aggregate.audio_bytes["out"] += size
+
+    def committed(self):
+        self._committed_at = time.monotonic()
+
+    def speech_stopped(self):
+        self._speech_stopped_at = time.monotonic()
+
+    def audio_delta(self):
+        """Called for every response.audio.delta from the Realtime API"""
+        if self._committed_at is None and self._speech_stopped_at is None:
+            return
+        now = time.monotonic()
+        if self._committed_at is not None:
+            latency = now - self._committed_at
+            self.commit_to_first_audio.add(latency)
+            self.aggregate.commit_to_first_audio.observe(latency)
+            self._committed_at = None
+        if self._speech_stopped_at is not None:
+            latency = now - self._speech_stopped_at
+            self.speech_stopped_to_first_audio.add(latency)
+            self.aggregate.speech_stopped_to_first_audio.observe(latency)
+            self._speech_stopped_at = None
+
+    def queue_changed(self, depth: int, enqueued: bool = False):
+        self.queue_depth = depth
+        if enqueued:
+            self.max_queue_depth = max(self.max_queue_depth, depth)
+            self.aggregate.send_queue_depth.observe(depth)
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self.aggregate.active_sessions -= 1
+
+    def get_stats(self) -> Dict:
+        return {
+            "duration_s": time.monotonic() - self.started_at,
+            "audio_bytes_in": self.audio_bytes_in,
+            "audio_bytes_out": self.audio_bytes_out,
+            "client_events": dict(self.client_events),
+            "upstream_events": dict(self.upstream_events),
+            "send_queue_depth": self.queue_depth,
+            "send_queue_max_depth": self.max_queue_depth,
+            "commit_to_first_audio": self.commit_to_first_audio.to_dict(),
+            "speech_stopped_to_first_audio": (
+                self.speech_stopped_to_first_audio.to_dict()
+            )
+        }
+
+
+# Global voice metrics of this worker
+voice_metrics = VoiceMetrics()
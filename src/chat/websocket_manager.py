@@ -1,131 +1,668 @@
-import json
+import asyncio
 import logging
+import time
+from collections import deque
 from datetime import datetime
-from typing import Dict, List
+from typing import Deque, Dict, List, Optional, Set, Tuple
 
-from fastapi import WebSocket
+from fastapi import WebSocket, WebSocketDisconnect
+
+from config import settings
+
+from .backplane import LocalBackplane, create_backplane
+from .codec import JSON_CODEC, OutboundFrame, negotiate_codec
+from .history import RecentMessages, create_recent_messages
 
 logger = logging.getLogger(__name__)
 
+# What to do when a connection's outbound queue is full
+SLOW_CONSUMER_POLICIES = ("drop_oldest", "drop_typing", "disconnect")
+# Message types that are safe to drop under the "drop_typing" policy
+DROPPABLE_TYPES = frozenset({"typing", "typing_batch"})
+# Backplane-only frame that carries a room's batching setting
+ROOM_CONFIG_TYPE = "room_config"
+
+
+class OutboundQueue:
+    """Bounded per-connection send queue with a slow-consumer policy"""
+
+    __slots__ = ("maxsize", "policy", "dropped", "_items", "_waiter")
+
+    def __init__(self, maxsize: int, policy: str = "drop_oldest"):
+        if policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"Unknown slow consumer policy: {policy}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.dropped = 0
+        self._items: Deque[Tuple[OutboundFrame, bool]] = deque()
+        # Created only while the writer waits; much lighter than an Event
+        # per connection
+        self._waiter: Optional[asyncio.Future] = None
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def put(self, item: OutboundFrame, droppable: bool = False) -> bool:
+        """
+        Enqueue an item without blocking.
+        Returns False when the consumer should be disconnected.
+        """
+        if len(self._items) >= self.maxsize:
+            if self.policy == "disconnect":
+                return False
+            if not self._make_room(droppable):
+                # The incoming item itself was the cheapest thing to lose
+                self.dropped += 1
+                return True
+        self._items.append((item, droppable))
+        self._wake()
+        return True
+
+    def _wake(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    def _make_room(self, incoming_droppable: bool) -> bool:
+        if self.policy == "drop_typing":
+            for index, (_, droppable) in enumerate(self._items):
+                if droppable:
+                    del self._items[index]
+                    self.dropped += 1
+                    return True
+            if incoming_droppable:
+                return False
+        self._items.popleft()
+        self.dropped += 1
+        return True
+
+    def push_front(self, items: List[OutboundFrame]):
+        """Queue items ahead of everything else, ignoring the size bound"""
+        self._items.extendleft((item, False) for item in reversed(items))
+        if items:
+            self._wake()
+
+    def message_ids(self) -> set:
+        ids = set()
+        for item, _ in self._items:
+            if item.type == "message":
+                ids.add(item.message.get("message_id"))
+            elif item.type == "batch":
+                ids.update(
+                    event.get("message_id")
+                    for event in item.message["events"]
+                    if event.get("type") == "message"
+                )
+        return ids
+
+    async def get(self) -> OutboundFrame:
+        while not self._items:
+            self._waiter = asyncio.get_running_loop().create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+        item, _ = self._items.popleft()
+        return item
+
+
+class Connection:
+    """One registered socket; slotted to keep 100k+ of them small"""
+
+    __slots__ = (
+        "websocket", "user_id", "username", "room_id", "codec", "queue",
+        "writer", "connected_at", "last_seen", "answers_pings",
+        "frames_sent", "bytes_sent"
+    )
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        user_id: int,
+        username: str,
+        room_id: int,
+        codec,
+        queue: OutboundQueue
+    ):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.username = username
+        self.room_id = room_id
+        self.codec = codec
+        self.queue = queue
+        self.writer: Optional[asyncio.Task] = None
+        self.connected_at = self.last_seen = time.monotonic()
+        # Set by the first "pong"; only such clients are reaped when idle
+        self.answers_pings = False
+        self.frames_sent = 0
+        self.bytes_sent = 0
+
+
+class Room:
+    """A room's sockets on this worker, indexed by socket and by user"""
+
+    __slots__ = ("connections", "users", "_members")
 
-class ConnectionManager:
     def __init__(self):
-        # Store active connections by room
-        self.active_connections: Dict[int, Dict[int, WebSocket]] = {}
-        # Store user info for each connection
-        self.user_connections: Dict[WebSocket, Dict[str, any]] = {}
+        # Fan-out iterates this set
+        self.connections: Set[Connection] = set()
+        # user_id -> that user's sockets (tabs, devices) in the room
+        self.users: Dict[int, Set[Connection]] = {}
+        self._members: Optional[List[Dict]] = None
 
-    async def connect(
-        self, websocket: WebSocket, room_id: int, user_id: int, username: str
+    def __len__(self) -> int:
+        return len(self.connections)
+
+    def add(self, connection: Connection) -> bool:
+        """Register a socket; True if it is the user's first in the room"""
+        self.connections.add(connection)
+        sockets = self.users.get(connection.user_id)
+        if sockets is None:
+            sockets = self.users[connection.user_id] = set()
+            self._members = None
+        sockets.add(connection)
+        return len(sockets) == 1
+
+    def remove(self, connection: Connection) -> bool:
+        """Unregister a socket; True if it was the user's last in the room"""
+        self.connections.discard(connection)
+        sockets = self.users.get(connection.user_id)
+        if sockets is None:
+            return False
+        sockets.discard(connection)
+        if sockets:
+            return False
+        del self.users[connection.user_id]
+        self._members = None
+        return True
+
+    def members(self) -> List[Dict]:
+        """Distinct users in the room, cached until someone joins or leaves"""
+        if self._members is None:
+            self._members = [
+                {
+                    "user_id": user_id,
+                    "username": next(iter(sockets)).username
+                }
+                for user_id, sockets in self.users.items()
+            ]
+        return self._members
+
+
+class ConnectionManager:
+    def __init__(
+        self,
+        queue_size: int = settings.chat_send_queue_size,
+        slow_consumer_policy: str = settings.chat_slow_consumer_policy,
+        backplane: LocalBackplane = None,
+        coalesce_window: float = settings.chat_coalesce_window_ms / 1000,
+        history: RecentMessages = None,
+        heartbeat_interval: float = settings.chat_heartbeat_interval,
+        idle_timeout: float = settings.chat_idle_timeout
     ):
-        await websocket.accept()
-        if room_id not in self.active_connections:
-            self.active_connections[room_id] = {}
-        self.active_connections[room_id][user_id] = websocket
-        self.user_connections[websocket] = {
-            "user_id": user_id,
-            "username": username,
-            "room_id": room_id
+        if slow_consumer_policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(
+                f"Unknown slow consumer policy: {slow_consumer_policy}"
+            )
+        self.queue_size = queue_size
+        self.slow_consumer_policy = slow_consumer_policy
+        # Rooms with at least one socket on this worker
+        self.rooms: Dict[int, Room] = {}
+        # Every registered socket, for lookups by WebSocket
+        self.connections: Dict[WebSocket, Connection] = {}
+        # Relays broadcasts to the other workers serving the same rooms
+        self.backplane = backplane or create_backplane()
+        self.backplane.bind(self._fan_out)
+        # Typing states and presence changes are coalesced per room and
+        # flushed once per window: room_id -> user_id -> latest state
+        self.coalesce_window = coalesce_window
+        self._pending_typing: Dict[int, Dict[int, Dict]] = {}
+        self._pending_presence: Dict[int, Dict[int, Dict]] = {}
+        self._flush_handles: Dict[int, asyncio.TimerHandle] = {}
+        # Rooms that opted into micro-batching collect broadcasts for their
+        # window and send them as one "batch" frame: room_id -> seconds
+        self.batch_windows: Dict[int, float] = {}
+        self._pending_batches: Dict[int, List[OutboundFrame]] = {}
+        self._batch_handles: Dict[int, asyncio.TimerHandle] = {}
+        # Last messages per room, replayed to resuming sockets
+        self.history = history or create_recent_messages()
+        # Sockets are pinged every interval. Those that have answered a ping
+        # with a "pong" are reaped when nothing has been received from them
+        # for idle_timeout seconds; older and listen-only clients never send
+        # frames, so for them uvicorn's protocol-level pings detect dead peers
+        self.heartbeat_interval = heartbeat_interval
+        self.idle_timeout = idle_timeout
+        self._heartbeat: Optional[asyncio.Task] = None
+        # Totals since start, including connections that are gone
+        self.counters: Dict[str, int] = {
+            "frames_sent": 0,
+            "bytes_sent": 0,
+            "frames_dropped": 0,
+            "send_errors": 0,
+            "slow_consumer_evictions": 0,
+            "idle_evictions": 0
         }
 
+    async def connect(
+        self,
+        websocket: WebSocket,
+        room_id: int,
+        user_id: int,
+        username: str,
+        last_message_id: Optional[int] = None,
+        batch_window_ms: Optional[int] = None
+    ):
+        """
+        Accept and register a socket. A user may hold several sockets in
+        the same room, e.g. one per tab or device.
+        batch_window_ms is the room's stored batching setting; it only
+        applies when this is the room's first socket on this worker.
+        """
+        codec, subprotocol = negotiate_codec(
+            websocket.scope.get("subprotocols", [])
+        )
+        await websocket.accept(subprotocol=subprotocol)
+        room = self.rooms.get(room_id)
+        if room is None:
+            room = self.rooms[room_id] = Room()
+            self.backplane.subscribe(room_id)
+            self._apply_batch_window(room_id, batch_window_ms)
+        connection = Connection(
+            websocket, user_id, username, room_id, codec,
+            OutboundQueue(self.queue_size, self.slow_consumer_policy)
+        )
+        first_socket = room.add(connection)
+        self.connections[websocket] = connection
+        if self._heartbeat is None:
+            self._heartbeat = asyncio.create_task(self._heartbeat_loop())
+
         logger.info(
             f"User {username} (ID: {user_id}) connected to room {room_id}"
         )
-        await self.broadcast_to_room(room_id, {
-            "type": "user_joined",
+        # Only the new socket needs the full list; everyone else gets a delta
+        connection.queue.put(OutboundFrame(self._user_list_message(room_id)))
+        if first_socket:
+            self._record_presence(room_id, user_id, username, "joined")
+        if last_message_id is not None:
+            await self._replay_missed(connection, last_message_id)
+            if self.connections.get(websocket) is not connection:
+                return
+        # Start writing only after any backlog is in place at the front
+        connection.writer = asyncio.create_task(self._write_loop(connection))
+
+    async def _replay_missed(self, connection: Connection, last_message_id: int):
+        """Queue the messages a resuming socket missed, oldest first"""
+        room_id = connection.room_id
+        queue = connection.queue
+        missed = self.history.missed_since(room_id, last_message_id)
+        if missed is None:
+            missed = await self.history.fetch_missed(room_id, last_message_id)
+            if missed is not None:
+                # Messages that arrived live while Redis was being read
+                live_ids = queue.message_ids()
+                missed = [
+                    frame for frame in missed
+                    if frame.message.get("message_id") not in live_ids
+                ]
+        if missed is None:
+            # Too far behind for the buffers; the client should page
+            # through GET /chat/rooms/{room_id}/messages instead
+            queue.push_front([OutboundFrame({
+                "type": "history_gap",
+                "room_id": room_id,
+                "last_message_id": last_message_id
+            })])
+        else:
+            queue.push_front(missed)
+
+    def disconnect(self, websocket: WebSocket):
+        connection = self.connections.pop(websocket, None)
+        if connection is None:
+            return
+        user_id = connection.user_id
+        username = connection.username
+        room_id = connection.room_id
+        last_socket = False
+        room = self.rooms.get(room_id)
+        if room is not None:
+            last_socket = room.remove(connection)
+            if not room:
+                del self.rooms[room_id]
+                self.backplane.unsubscribe(room_id)
+                self.history.forget(room_id)
+                self._drop_batching(room_id)
+        writer = connection.writer
+        if writer is not None and writer is not asyncio.current_task():
+            writer.cancel()
+        self.counters["frames_dropped"] += connection.queue.dropped
+        logger.info(
+            f"User {username} (ID: {user_id}) disconnected from room {room_id}"
+        )
+        if last_socket:
+            # Other tabs of the same user keep them present and typing
+            self._pending_typing.get(room_id, {}).pop(user_id, None)
+            self._record_presence(room_id, user_id, username, "left")
+
+    def set_typing(
+        self, room_id: int, user_id: int, username: str, is_typing: bool
+    ):
+        """Record a typing state; only the latest per user is sent"""
+        self._pending_typing.setdefault(room_id, {})[user_id] = {
             "user_id": user_id,
             "username": username,
-            "timestamp": datetime.now().isoformat()
-        }, exclude_user=user_id)
-        await self.send_user_list(room_id)
+            "is_typing": is_typing
+        }
+        self._schedule_flush(room_id)
 
-    def disconnect(self, websocket: WebSocket):
-        if websocket in self.user_connections:
-            user_info = self.user_connections[websocket]
-            user_id = user_info["user_id"]
-            username = user_info["username"]
-            room_id = user_info["room_id"]
-            if (room_id in self.active_connections and
-                user_id in self.active_connections[room_id]):
-                del self.active_connections[room_id][user_id]
-                if not self.active_connections[room_id]:
-                    del self.active_connections[room_id]
-            del self.user_connections[websocket]
-            logger.info(
-                f"User {username} (ID: {user_id}) disconnected from room {room_id}"
+    def _record_presence(
+        self, room_id: int, user_id: int, username: str, change: str
+    ):
+        self._pending_presence.setdefault(room_id, {})[user_id] = {
+            "user_id": user_id,
+            "username": username,
+            "change": change
+        }
+        self._schedule_flush(room_id)
+
+    def _schedule_flush(self, room_id: int):
+        if room_id not in self._flush_handles:
+            loop = asyncio.get_running_loop()
+            self._flush_handles[room_id] = loop.call_later(
+                self.coalesce_window, self._flush_room_events, room_id
             )
-            if room_id in self.active_connections:
-                import asyncio
-                asyncio.create_task(self.broadcast_to_room(room_id, {
-                    "type": "user_left",
-                    "user_id": user_id,
-                    "username": username,
-                    "timestamp": datetime.now().isoformat()
-                }, exclude_user=user_id))
-                asyncio.create_task(self.send_user_list(room_id))
 
-    async def send_personal_message(self, message: str, websocket: WebSocket):
+    def _flush_room_events(self, room_id: int):
+        """Send one presence delta and one typing batch for the window"""
+        self._flush_handles.pop(room_id, None)
+        presence = self._pending_presence.pop(room_id, None)
+        if presence:
+            joined, left = [], []
+            for entry in presence.values():
+                user = {
+                    "user_id": entry["user_id"],
+                    "username": entry["username"]
+                }
+                (joined if entry["change"] == "joined" else left).append(user)
+            self._broadcast(room_id, {
+                "type": "presence",
+                "room_id": room_id,
+                "joined": joined,
+                "left": left,
+                "timestamp": datetime.now().isoformat()
+            })
+        typing = self._pending_typing.pop(room_id, None)
+        if typing:
+            # Senders receive their own state too; clients skip their user_id
+            self._broadcast(room_id, {
+                "type": "typing_batch",
+                "room_id": room_id,
+                "users": list(typing.values())
+            })
+
+    async def _write_loop(self, connection: Connection):
+        """Drain one connection's queue so a slow socket only stalls itself"""
+        websocket = connection.websocket
+        queue = connection.queue
+        codec = connection.codec
+        counters = self.counters
+        try:
+            while True:
+                frame = await queue.get()
+                payload = frame.encode(codec)
+                if codec.binary:
+                    await websocket.send_bytes(payload)
+                else:
+                    await websocket.send_text(payload)
+                size = frame.size(codec)
+                connection.frames_sent += 1
+                connection.bytes_sent += size
+                counters["frames_sent"] += 1
+                counters["bytes_sent"] += size
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error sending to connection: {e}")
+            counters["send_errors"] += 1
+            self.disconnect(websocket)
+
+    async def _heartbeat_loop(self):
+        """Ping every socket and reap the ones that went quiet"""
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            deadline = time.monotonic() - self.idle_timeout
+            # One shared frame, encoded once per codec
+            ping = OutboundFrame({"type": "ping", "ts": time.time()})
+            idle_connections = []
+            for websocket, connection in list(self.connections.items()):
+                if connection.answers_pings and connection.last_seen < deadline:
+                    idle_connections.append(websocket)
+                elif len(connection.queue):
+                    # Frames are already on their way; a ping would only
+                    # push one out of a full queue under drop_oldest
+                    continue
+                elif not connection.queue.put(ping, droppable=True):
+                    self.counters["slow_consumer_evictions"] += 1
+                    self._evict(websocket)
+            for websocket in idle_connections:
+                logger.info("Reaping idle chat connection")
+                self.counters["idle_evictions"] += 1
+                # 1001: going away; the client may reconnect and resume
+                self._evict(websocket, code=1001)
+
+    def _evict(self, websocket: WebSocket, code: int = 1013):
+        """Drop a connection the server gave up on and close its socket"""
+        self.disconnect(websocket)
+        asyncio.create_task(self._close_quietly(websocket, code=code))
+
+    async def close(self, websocket: WebSocket, code: int = 1000):
+        """Unregister a connection and close its socket"""
+        self.disconnect(websocket)
+        await self._close_quietly(websocket, code)
+
+    async def _close_quietly(self, websocket: WebSocket, code: int):
+        try:
+            await websocket.close(code=code)
+        except Exception:
+            pass
+
+    async def send_personal_message(self, message: dict, websocket: WebSocket):
+        connection = self.connections.get(websocket)
+        if connection is not None:
+            if not connection.queue.put(OutboundFrame(message)):
+                self.counters["slow_consumer_evictions"] += 1
+                self._evict(websocket)
+            return
         try:
-            await websocket.send_text(message)
+            await websocket.send_text(JSON_CODEC.encode(message))
         except Exception as e:
             logger.error(f"Error sending personal message: {e}")
 
+    async def receive_message(self, websocket: WebSocket) -> dict:
+        """
+        Receive and decode one inbound frame with the connection's codec.
+        Any frame, including a "pong", counts as a sign of life, and a
+        "pong" opts the connection into idle reaping.
+        Raises CodecError for undecodable frames.
+        """
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(message.get("code", 1000))
+        connection = self.connections.get(websocket)
+        if connection is None:
+            # Evicted by the server while we were waiting
+            raise WebSocketDisconnect(1001)
+        connection.last_seen = time.monotonic()
+        data = message.get("bytes")
+        if data is None:
+            data = message.get("text")
+        decoded = connection.codec.decode(data)
+        if decoded.get("type") == "pong":
+            connection.answers_pings = True
+        return decoded
+
     async def broadcast_to_room(
         self, room_id: int, message: dict, exclude_user: int = None
     ):
-        if room_id not in self.active_connections:
+        """Enqueue a message for every connection in the room and return"""
+        self._broadcast(room_id, message, exclude_user)
+
+    def _broadcast(self, room_id: int, message: dict, exclude_user: int = None):
+        frame = OutboundFrame(message)
+        self._fan_out(room_id, frame, exclude_user)
+        self.backplane.publish(room_id, frame, exclude_user)
+        if frame.type == "message":
+            self.history.mirror(room_id, frame)
+
+    def set_batch_window(self, room_id: int, window_ms: Optional[int]):
+        """Change a room's batching window here and on the other workers"""
+        self._apply_batch_window(room_id, window_ms)
+        self.backplane.publish(room_id, OutboundFrame({
+            "type": ROOM_CONFIG_TYPE,
+            "batch_window_ms": window_ms
+        }))
+
+    def _apply_batch_window(self, room_id: int, window_ms: Optional[int]):
+        if room_id not in self.rooms:
+            # Picked up from the database when the room is next connected
             return
-        message_text = json.dumps(message)
-        disconnected_connections = []
-        for user_id, connection in self.active_connections[room_id].items():
-            if exclude_user and user_id == exclude_user:
-                continue
-            try:
-                await connection.send_text(message_text)
-            except Exception as e:
-                logger.error(f"Error broadcasting to user {user_id}: {e}")
-                disconnected_connections.append(connection)
-        for connection in disconnected_connections:
-            self.disconnect(connection)
-
-    async def send_user_list(self, room_id: int):
-        if room_id not in self.active_connections:
+        if window_ms:
+            self.batch_windows[room_id] = window_ms / 1000
+        elif self.batch_windows.pop(room_id, None) is not None:
+            self._flush_batch(room_id)
+
+    def _drop_batching(self, room_id: int):
+        self.batch_windows.pop(room_id, None)
+        self._pending_batches.pop(room_id, None)
+        handle = self._batch_handles.pop(room_id, None)
+        if handle is not None:
+            handle.cancel()
+
+    def _flush_batch(self, room_id: int):
+        """Send whatever a batching room collected during its window"""
+        handle = self._batch_handles.pop(room_id, None)
+        if handle is not None:
+            handle.cancel()
+        frames = self._pending_batches.pop(room_id, None)
+        if not frames:
+            return
+        if len(frames) == 1:
+            self._deliver(room_id, frames[0])
+        else:
+            self._deliver(room_id, OutboundFrame.batch(room_id, frames))
+
+    def _fan_out(
+        self, room_id: int, frame: OutboundFrame, exclude_user: int = None
+    ):
+        if frame.type == ROOM_CONFIG_TYPE:
+            self._apply_batch_window(
+                room_id, frame.message.get("batch_window_ms")
+            )
+            return
+        if room_id not in self.rooms:
+            return
+        if frame.type == "message":
+            self.history.record(room_id, frame)
+        window = self.batch_windows.get(room_id)
+        if window is not None:
+            if exclude_user is None:
+                pending = self._pending_batches.setdefault(room_id, [])
+                pending.append(frame)
+                if room_id not in self._batch_handles:
+                    loop = asyncio.get_running_loop()
+                    self._batch_handles[room_id] = loop.call_later(
+                        window, self._flush_batch, room_id
+                    )
+                return
+            # Per-recipient frames can't share a batch; keep the order by
+            # sending what was collected so far first
+            self._flush_batch(room_id)
+        self._deliver(room_id, frame, exclude_user)
+
+    def _deliver(
+        self, room_id: int, frame: OutboundFrame, exclude_user: int = None
+    ):
+        room = self.rooms.get(room_id)
+        if room is None:
             return
-        users = []
-        for user_id, connection in self.active_connections[room_id].items():
-            if connection in self.user_connections:
-                user_info = self.user_connections[connection]
-                users.append({
-                    "user_id": user_info["user_id"],
-                    "username": user_info["username"]
-                })
-        message = {
+        droppable = frame.type in DROPPABLE_TYPES
+        slow_connections = []
+        for connection in room.connections:
+            if exclude_user and connection.user_id == exclude_user:
+                continue
+            if not connection.queue.put(frame, droppable):
+                logger.warning(
+                    f"Disconnecting slow consumer {connection.user_id} "
+                    f"in room {room_id}"
+                )
+                slow_connections.append(connection.websocket)
+        for websocket in slow_connections:
+            self.counters["slow_consumer_evictions"] += 1
+            self._evict(websocket)
+
+    def _user_list_message(self, room_id: int) -> dict:
+        return {
             "type": "user_list",
-            "users": users,
+            "users": self.get_room_users(room_id),
             "room_id": room_id,
             "timestamp": datetime.now().isoformat()
         }
-        await self.broadcast_to_room(room_id, message)
 
     def get_room_users(self, room_id: int) -> List[Dict]:
-        if room_id not in self.active_connections:
+        room = self.rooms.get(room_id)
+        if room is None:
             return []
-        users = []
-        for user_id, connection in self.active_connections[room_id].items():
-            if connection in self.user_connections:
-                user_info = self.user_connections[connection]
-                users.append({
-                    "user_id": user_info["user_id"],
-                    "username": user_info["username"]
-                })
-        return users
+        return room.members()
 
     def get_connection_count(self, room_id: int = None) -> int:
         if room_id:
-            return len(self.active_connections.get(room_id, {}))
-        return sum(
-            len(connections) for connections in self.active_connections.values()
-        )
+            room = self.rooms.get(room_id)
+            return len(room) if room is not None else 0
+        return len(self.connections)
+
+    def get_stats(self) -> Dict:
+        """Per-room connection, traffic and queue figures for this worker"""
+        rooms = {}
+        dropped = self.counters["frames_dropped"]
+        for room_id, room in self.rooms.items():
+            stats = rooms[room_id] = {
+                "connections": len(room),
+                "users": len(room.users),
+                "batch_window_ms": (
+                    round(self.batch_windows[room_id] * 1000)
+                    if room_id in self.batch_windows else None
+                ),
+                "frames_sent": 0,
+                "bytes_sent": 0,
+                "queue_depth": 0,
+                "max_queue_depth": 0,
+                "frames_dropped": 0
+            }
+            for connection in room.connections:
+                depth = len(connection.queue)
+                stats["frames_sent"] += connection.frames_sent
+                stats["bytes_sent"] += connection.bytes_sent
+                stats["queue_depth"] += depth
+                stats["max_queue_depth"] = max(stats["max_queue_depth"], depth)
+                stats["frames_dropped"] += connection.queue.dropped
+            dropped += stats["frames_dropped"]
+        return {
+            "total_connections": self.get_connection_count(),
+            "active_rooms": len(self.rooms),
+            "totals": {**self.counters, "frames_dropped": dropped},
+            "rooms": rooms
+        }
+
+    async def shutdown(self):
+        """Stop background relays; called on application shutdown"""
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            self._heartbeat = None
+        for room_id in list(self._flush_handles):
+            self._flush_handles[room_id].cancel()
+            self._flush_room_events(room_id)
+        for room_id in list(self._batch_handles):
+            self._flush_batch(room_id)
+        await self.backplane.close()
+        await self.history.close()
 
 
 # Global connection manager instance
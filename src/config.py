@@ -1,3 +1,5 @@
+from typing import Optional
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -7,10 +9,60 @@ class Settings(BaseSettings):
     secret_key: str
     algorithm: str
     access_token_expire_minutes: int
+    auth_token_cache_size: int = 100000
     redis_url: str = "redis://localhost:6379/0"
     celery_broker_url: str = "redis://localhost:6379/0"
     celery_result_backend: str = "redis://localhost:6379/0"
     openai_api_key: str
+    # Override the realtime WebSocket endpoint, e.g. ws://localhost:8765/v1
+    openai_realtime_url: Optional[str] = None
+    openai_realtime_model: str = "gpt-4o-realtime-preview"
+    chat_send_queue_size: int = 256
+    chat_slow_consumer_policy: str = "drop_oldest"
+    chat_backplane: str = "local"
+    chat_coalesce_window_ms: int = 100
+    chat_write_batch_size: int = 500
+    chat_write_flush_interval_ms: int = 200
+    chat_id_block_size: int = 1000
+    # Unsaved messages a worker holds before refusing new ones
+    chat_write_max_buffer: int = 20000
+    chat_message_max_length: int = 4000
+    chat_history_page_size: int = 50
+    chat_recent_messages: int = 100
+    chat_recent_messages_ttl: int = 86400
+    chat_recent_messages_mirror: bool = True
+    chat_membership_ttl: int = 300
+    chat_membership_max_users: int = 100000
+    chat_heartbeat_interval: float = 25.0
+    chat_idle_timeout: float = 60.0
+    chat_rate_limit_connection_rate: float = 5.0
+    chat_rate_limit_connection_burst: float = 20.0
+    chat_rate_limit_user_rate: float = 10.0
+    chat_rate_limit_user_burst: float = 40.0
+    chat_rate_limit_max_strikes: int = 20
+    chat_rate_limit_strike_window: float = 10.0
+    chat_rate_limit_global_per_minute: int = 0
+    chat_batch_max_window_ms: int = 50
+    chat_search_page_size: int = 20
+    chat_search_candidate_limit: int = 10000
+    chat_history_hot_months: int = 3
+    chat_partition_months_ahead: int = 2
+    chat_archive_after_months: int = 12
+    chat_archive_dir: str = "archive/messages"
+    chat_read_marker_flush_interval_ms: int = 1000
+    chat_room_page_size: int = 50
+    voice_input_frame_ms: int = 100
+    voice_input_max_delay_ms: int = 200
+    voice_vad_enabled: bool = False
+    voice_vad_frame_ms: int = 20
+    voice_vad_energy_threshold_db: float = -50.0
+    voice_vad_zcr_threshold: float = 0.35
+    # Longer than the Realtime API's server VAD silence_duration_ms (500)
+    voice_vad_hangover_ms: int = 600
+    voice_vad_preroll_ms: int = 200
+    voice_pool_size: int = 2
+    voice_pool_idle_timeout: float = 300.0
+    voice_send_queue_size: int = 64
 
     model_config = SettingsConfigDict(
         env_file=".env", env_file_encoding="utf-8"
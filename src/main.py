@@ -1,3 +1,5 @@
+from contextlib import asynccontextmanager
+
 from fastapi import Depends, FastAPI, HTTPException
 from fastapi.responses import HTMLResponse
 from sqlalchemy import text
@@ -5,13 +7,32 @@ from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from auth.api import router as auth_router
+from auth.token_cache import token_cache
 from celery_tasks import example_task, process_data, send_notification
 from chat.api import router as chat_router
+from chat.persistence import message_writer
+from chat.read_markers import read_markers
+from chat.voice_chat import voice_manager
+from chat.websocket_manager import manager as chat_manager
 from database import get_async_db
 from redis_client import test_redis_connection
 from tasks.api import router as tasks_router
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await token_cache.start()
+    await voice_manager.start()
+    yield
+    await voice_manager.shutdown()
+    await chat_manager.shutdown()
+    # Persist buffered chat messages before the process exits
+    await message_writer.stop()
+    await read_markers.stop()
+    await token_cache.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.include_router(auth_router, tags=["auth"])
 app.include_router(chat_router, tags=["chat"])
@@ -1,9 +1,15 @@
 import redis
+import redis.asyncio
 from config import settings
 
 # Create Redis client
 redis_client = redis.Redis.from_url(settings.redis_url, decode_responses=True)
 
+# Asyncio Redis client for use inside the event loop (pub/sub, caches)
+async_redis_client = redis.asyncio.Redis.from_url(
+    settings.redis_url, decode_responses=True
+)
+
 # Test connection
 def test_redis_connection():
     try:
@@ -5,7 +5,7 @@
 
 import asyncio
 import json
-import random
+import os
 
 import websockets
 
@@ -13,16 +13,20 @@ import websockets
 async def test_websocket():
     # Параметры подключения
     room_id = 1
-    user_id = random.randint(1, 1000)
-    username = f"TestUser{user_id}"
+    # Токен доступа из POST /auth/token
+    token = os.environ["CHAT_TOKEN"]
+    username = "TestUser"
     
     # URL WebSocket
-    ws_url = f"ws://localhost:8000/chat/ws/{room_id}?user_id={user_id}&username={username}"
+    ws_url = f"ws://localhost:8000/chat/ws/{room_id}"
     
     print(f"Подключение к: {ws_url}")
     
     try:
-        async with websockets.connect(ws_url) as websocket:
+        # Токен передаётся как подпротокол, а не в URL
+        async with websockets.connect(
+            ws_url, subprotocols=["chat.json", f"auth.bearer.{token}"]
+        ) as websocket:
             print(f"✅ Подключен как {username}")
             test_message = {
                 "type": "message",